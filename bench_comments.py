@@ -0,0 +1,100 @@
+# 评论加载基准测试：统计加载一条新闻全部评论时执行的sql条数
+# 分别使用逐条to_dict和Comment.load_thread加载，评论数量递增
+# 测试数据只flush不提交，测试结束后回滚
+# 在终端使用命令：python bench_comments.py
+import time
+
+from sqlalchemy import event
+
+from info import db
+from info.models import User, News, Comment, CommentLike
+from manage import app
+
+
+class QueryCounter(object):
+    """统计sql执行条数"""
+    def __init__(self, engine):
+        self.engine = engine
+        self.count = 0
+
+    def callback(self, *args, **kwargs):
+        self.count += 1
+
+    def __enter__(self):
+        self.count = 0
+        event.listen(self.engine, 'before_cursor_execute', self.callback)
+        return self
+
+    def __exit__(self, *args):
+        event.remove(self.engine, 'before_cursor_execute', self.callback)
+
+
+def create_comments(news, users, count):
+    """创建count条评论，每隔一条回复上一条评论，当前用户点赞其中一半"""
+    comments = []
+    for num in range(count):
+        comment = Comment()
+        comment.user_id = users[num % len(users)].id
+        comment.news_id = news.id
+        comment.content = '评论%d' % num
+        if num % 2 and comments:
+            comment.parent_id = comments[-1].id
+        db.session.add(comment)
+        db.session.flush()
+        comments.append(comment)
+    for comment in comments[::2]:
+        like = CommentLike()
+        like.comment_id = comment.id
+        like.user_id = users[0].id
+        db.session.add(like)
+    db.session.flush()
+
+
+def bench_comments():
+    with app.app_context():
+        engine = db.engine
+        try:
+            users = []
+            for num in range(20):
+                user = User()
+                user.nick_name = 'bench%d' % num
+                user.mobile = 'bench%d' % num
+                user.password_hash = 'bench'
+                db.session.add(user)
+                users.append(user)
+            db.session.flush()
+
+            print('评论数\t逐条to_dict(sql条数/耗时)\tload_thread(sql条数/耗时)')
+            for count in (10, 100, 500):
+                news = News()
+                news.title = 'bench'
+                news.source = 'bench'
+                news.digest = 'bench'
+                news.content = 'bench'
+                news.user_id = users[0].id
+                db.session.add(news)
+                db.session.flush()
+                create_comments(news, users, count)
+                db.session.expire_all()
+
+                with QueryCounter(engine) as old_counter:
+                    begin = time.time()
+                    comments = Comment.query.filter(Comment.news_id == news.id).all()
+                    for comment in comments:
+                        comment.to_dict()
+                    old_time = time.time() - begin
+                db.session.expire_all()
+
+                with QueryCounter(engine) as new_counter:
+                    begin = time.time()
+                    Comment.load_thread(news.id, users[0].id)
+                    new_time = time.time() - begin
+
+                print('%d\t%d / %.3fs\t%d / %.3fs' % (count, old_counter.count, old_time,
+                                                      new_counter.count, new_time))
+        finally:
+            db.session.rollback()
+
+
+if __name__ == '__main__':
+    bench_comments()
@@ -0,0 +1,65 @@
+# 实时评论推送压力测试：逐步增加SSE连接数量，记录服务器进程的内存占用(RSS)
+# 先启动协程服务器：python live_server.py 5001
+# 在终端使用命令：python bench_live.py <服务器进程id> [新闻id] [端口]
+# 连接数量较多时需要先调大文件描述符上限，例如 ulimit -n 20000
+from gevent import monkey
+monkey.patch_all()
+
+import socket
+import sys
+import time
+
+import gevent
+
+# 每一步的连接总数
+STEPS = (0, 100, 500, 1000, 2000, 5000)
+
+
+def get_rss(pid):
+    """读取进程的内存占用，单位：KB"""
+    with open('/proc/%d/status' % pid) as f:
+        for line in f:
+            if line.startswith('VmRSS:'):
+                return int(line.split()[1])
+    return 0
+
+
+def open_stream(port, news_id):
+    """建立一个SSE连接，读到第一条消息后返回，连接保持打开"""
+    sock = socket.create_connection(('127.0.0.1', port))
+    sock.sendall(('GET /news/%d/stream HTTP/1.1\r\nHost: 127.0.0.1\r\nAccept: text/event-stream\r\n\r\n'
+                  % news_id).encode())
+    data = b''
+    while b'retry' not in data:
+        chunk = sock.recv(4096)
+        if not chunk:
+            sock.close()
+            return None
+        data += chunk
+    return sock
+
+
+def bench_live(pid, news_id, port):
+    socks = []
+    base_rss = get_rss(pid)
+    print('连接数\t服务器内存(MB)\t每个连接增加(KB)')
+    for step in STEPS:
+        jobs = [gevent.spawn(open_stream, port, news_id) for _ in range(step - len(socks))]
+        gevent.joinall(jobs)
+        socks.extend(job.value for job in jobs if job.value)
+        # 等待服务器回收临时内存
+        time.sleep(1)
+        rss = get_rss(pid)
+        per_conn = (rss - base_rss) / len(socks) if socks else 0
+        print('%d\t%.1f\t%.1f' % (len(socks), rss / 1024.0, per_conn))
+    for sock in socks:
+        sock.close()
+
+
+if __name__ == '__main__':
+    if len(sys.argv) < 2:
+        print('使用方法：python bench_live.py <服务器进程id> [新闻id] [端口]')
+        sys.exit(1)
+    bench_live(int(sys.argv[1]),
+               int(sys.argv[2]) if len(sys.argv) > 2 else 1,
+               int(sys.argv[3]) if len(sys.argv) > 3 else 5001)
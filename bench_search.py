@@ -0,0 +1,40 @@
+# 新闻搜索基准测试：比较标题LIKE查询和redis倒排索引搜索的耗时
+# 使用数据库中已有的新闻数据，测试前先执行 python manage.py reindex 建立索引
+# 在终端使用命令：python bench_search.py
+import time
+
+from info import constants
+from info.models import News
+from info.utils.search import search_news
+from manage import app
+
+KEYWORDS = ('经济', '人工智能', '股市 行情', 'python', '世界杯')
+ROUNDS = 20
+
+
+def like_search(keywords, page, per_page=constants.SEARCH_PAGE_MAX_NEWS):
+    """原来的搜索方式：标题包含关键字，按发布时间排序"""
+    paginate = News.query.filter(News.status == 0, News.title.contains(keywords)) \
+        .order_by(News.create_time.desc()).paginate(page, per_page, False)
+    return [news.id for news in paginate.items], paginate.total
+
+
+def timeit(func, keywords):
+    begin = time.time()
+    for _ in range(ROUNDS):
+        result = func(keywords, 1)
+    return (time.time() - begin) / ROUNDS, result[1]
+
+
+def bench_search():
+    with app.app_context():
+        print('新闻总数：%d' % News.query.filter(News.status == 0).count())
+        print('关键字\tLIKE(结果数/平均耗时)\t倒排索引(结果数/平均耗时)')
+        for keywords in KEYWORDS:
+            like_time, like_total = timeit(like_search, keywords)
+            index_time, index_total = timeit(search_news, keywords)
+            print('%s\t%d / %.4fs\t%d / %.4fs' % (keywords, like_total, like_time, index_total, index_time))
+
+
+if __name__ == '__main__':
+    bench_search()
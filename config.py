@@ -20,6 +20,18 @@ class Config:
     SESSION_USE_SIGNER = True
     # flask框架自带的配置session有效期
     PERMANENT_SESSION_LIFETIME = 86400
+    # 在进程内写回新闻点击量的间隔，单位：秒
+    # 为None时不启动写回线程，需要使用python manage.py flush_clicks写回
+    CLICK_FLUSH_INTERVAL = None
+    # 新闻详情页外壳模式：所有用户共用同一份缓存的页面，可以被CDN缓存，
+    # 登录用户、收藏、关注、点赞状态由页面加载后请求/news/<id>/viewer_state获取
+    NEWS_DETAIL_SHELL = False
+    # 模板中的静态文件使用python manage.py assets发布的带哈希的地址
+    # 为False时使用/static/下的原文件，开发时修改静态文件不需要重新发布
+    USE_ASSET_MANIFEST = False
+    # 详情页实时评论推送(/news/<id>/stream)，每个连接长期占用一个工作线程，
+    # 需要由nginx把该路径转发到协程服务器(live_server.py)后才能开启
+    NEWS_LIVE_STREAM = False
 
 # 自定义开发模式下的配置类
 class DevelopmentConfig(Config):
@@ -28,6 +40,7 @@ class DevelopmentConfig(Config):
 # 自定义生产模式下的配置类
 class ProductionConfig(Config):
     DEBUG = False
+    USE_ASSET_MANIFEST = True
 
 
 # 定义字段，来映射不同的的配置类
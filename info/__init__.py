@@ -53,6 +53,9 @@ def create_app(config_name):
     # 请求钩子，在每次请求后都执行,给客户端写入csrf_token
     @app.after_request
     def after_request(response):
+        # 可以被公共缓存的响应不写入cookie，由之后的个性化请求写入
+        if response.cache_control.public:
+            return response
         csrf_token = csrf.generate_csrf()
         response.set_cookie('csrf_token',csrf_token)
         return response
@@ -60,6 +63,9 @@ def create_app(config_name):
     # 导入自定义的过滤器
     from info.utils.commons import index_filter
     app.add_template_filter(index_filter,'index_filter')
+    # 注册asset_url模板函数和发布后的静态文件路由
+    from info.utils.assets import init_assets
+    init_assets(app)
 
     # 导入蓝图，注册蓝图
     from info.modules.news import news_blue
@@ -71,6 +77,15 @@ def create_app(config_name):
     from info.modules.admin import admin_blue
     app.register_blueprint(admin_blue)
 
+    # 订阅新闻缓存失效通知，删除进程内缓存
+    from info.utils.news_cache import start_invalidation_listener
+    start_invalidation_listener(app)
+
+    # 如果配置了写回间隔，启动后台线程定期把redis中的点击量写回mysql
+    if app.config.get('CLICK_FLUSH_INTERVAL'):
+        from info.utils.click_counter import start_click_flusher
+        start_click_flusher(app, app.config['CLICK_FLUSH_INTERVAL'])
+
     return app
 
 
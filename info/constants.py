@@ -11,6 +11,9 @@ QINIU_DOMIN_PREFIX = "http://p8m0n4bb5.bkt.clouddn.com/"
 # 首页展示最多的新闻数量
 HOME_PAGE_MAX_NEWS = 10
 
+# 新闻列表接口每页最多的新闻数量
+NEWS_LIST_PER_PAGE_MAX = 50
+
 # 用户的关注每一页最多数量
 USER_FOLLOWED_MAX_COUNT = 4
 
@@ -30,3 +33,124 @@ ADMIN_USER_PAGE_MAX_COUNT = 10
 ADMIN_NEWS_PAGE_MAX_COUNT = 10
 
 
+
+# redis中缓存的新闻摘要数据有效期，单位：秒
+NEWS_SUMMARY_REDIS_EXPIRES = 3600
+
+# 点击量批量写回mysql时，每条update语句包含的新闻数量
+CLICK_FLUSH_BATCH_SIZE = 500
+
+# 点击量写回任务的锁有效期，单位：秒
+CLICK_FLUSH_LOCK_EXPIRES = 60
+
+# 已写回的点击量批次记录的保存时间，单位：秒，超过后删除
+CLICK_FLUSH_RECORD_EXPIRES = 86400
+
+# 新闻列表总数在redis中的缓存有效期，单位：秒
+NEWS_COUNT_REDIS_EXPIRES = 60
+
+# redis中每个分类缓存的最新新闻id数量
+NEWS_LATEST_MAX = 200
+
+# redis中缓存的新闻详情数据有效期，单位：秒
+NEWS_DETAIL_REDIS_EXPIRES = 300
+
+# 进程内新闻缓存的最大条数
+NEWS_LOCAL_CACHE_MAX = 1000
+
+# 进程内新闻缓存的有效期，单位：秒
+NEWS_LOCAL_CACHE_EXPIRES = 60
+
+# 未登录用户首页的页面缓存有效期，单位：秒
+PAGE_CACHE_EXPIRES = 10
+
+# 页面片段(点击排行、新闻分类)的缓存有效期，单位：秒
+FRAGMENT_CACHE_EXPIRES = 30
+
+# 页面缓存过期后，重新渲染期间允许返回旧页面的时间，单位：秒
+PAGE_CACHE_STALE_EXPIRES = 60
+
+# 新闻详情页每次加载的评论数量
+COMMENT_PAGE_MAX_COUNT = 10
+
+# 评论接口每次最多返回的评论数量
+COMMENT_PAGE_LIMIT_MAX = 50
+
+# redis中缓存的用户收藏、关注集合有效期，单位：秒
+MEMBERSHIP_REDIS_EXPIRES = 86400
+
+# redis中缓存的评论点赞用户集合有效期，单位：秒，有未写回的点赞记录时不过期
+COMMENT_LIKERS_REDIS_EXPIRES = 86400
+
+# 搜索结果在redis中的缓存有效期，单位：秒
+SEARCH_RESULT_REDIS_EXPIRES = 60
+
+# 搜索结果每页最多新闻数量
+SEARCH_PAGE_MAX_NEWS = 10
+
+# 搜索提示建立前缀索引的最大前缀长度
+SUGGEST_PREFIX_MAX_LENGTH = 12
+
+# 搜索提示每个前缀保留的新闻数量，也是每次最多返回的提示数量
+SUGGEST_MAX_COUNT = 10
+
+# 新闻详情页外壳的缓存有效期，也是浏览器、CDN的缓存时间，单位：秒
+NEWS_SHELL_CACHE_EXPIRES = 60
+
+# 热门新闻热度的半衰期，单位：秒
+TRENDING_HALF_LIFE = 21600
+
+# 已计入热度的评论点赞记录保存时间，单位：秒，超过后点赞带来的热度已衰减到可以忽略
+TRENDING_LIKE_CREDIT_EXPIRES = 7 * 86400
+
+# 热门新闻每个分类保留的新闻数量
+TRENDING_KEEP_COUNT = 500
+
+# 热门新闻热度低于该值时，重新计算基准时间时删除
+TRENDING_MIN_SCORE = 0.01
+
+# 热门新闻每个分类默认返回的新闻数量
+TRENDING_MAX_COUNT = 10
+
+# 热门新闻接口每个分类最多返回的新闻数量
+TRENDING_LIMIT_MAX = 50
+
+# 关注时间线每个用户缓存的新闻数量
+TIMELINE_MAX_COUNT = 500
+
+# 作者粉丝数量超过该值时不推送到粉丝的时间线，粉丝读取时间线时再查询
+TIMELINE_FANOUT_MAX_FOLLOWERS = 1000
+
+# 每次推送的时间线数量
+TIMELINE_FANOUT_BATCH_SIZE = 500
+
+# redis中缓存的关注时间线有效期，单位：秒
+TIMELINE_REDIS_EXPIRES = 604800
+
+# 关注时间线每页新闻数量
+TIMELINE_PAGE_MAX_NEWS = 10
+
+# 每条新闻保存的相关新闻数量
+RELATED_MAX_COUNT = 5
+
+# 相关度中标题摘要相似度和共同收藏相似度的权重
+RELATED_TEXT_WEIGHT = 0.7
+RELATED_COLLECT_WEIGHT = 0.3
+
+# 新闻每日访客HyperLogLog的有效期，单位：秒，需要大于汇总任务的执行间隔
+NEWS_UV_DAILY_REDIS_EXPIRES = 691200
+
+# 新闻每周访客HyperLogLog的有效期，单位：秒
+NEWS_UV_WEEKLY_REDIS_EXPIRES = 3024000
+
+# 新闻每月访客HyperLogLog的有效期，单位：秒
+NEWS_UV_MONTHLY_REDIS_EXPIRES = 34560000
+
+# 实时评论推送的心跳间隔，单位：秒，用于发现已断开的连接
+LIVE_HEARTBEAT_SECONDS = 15
+
+# 实时评论推送每个连接最多积压的消息数量，超过后丢弃新消息
+LIVE_QUEUE_MAX = 100
+
+# 批量接口一次请求最多包含的操作数量
+BATCH_MAX_OPS = 20
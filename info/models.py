@@ -1,4 +1,5 @@
 from datetime import datetime
+from sqlalchemy.orm import load_only
 from werkzeug.security import generate_password_hash, check_password_hash
 
 from info import constants
@@ -10,6 +11,18 @@ class BaseModel(object):
     create_time = db.Column(db.DateTime, default=datetime.now)  # 记录的创建时间
     update_time = db.Column(db.DateTime, default=datetime.now, onupdate=datetime.now)  # 记录的更新时间
 
+    @classmethod
+    def incr_counter(cls, obj_id, name, amount=1):
+        """
+        在当前事务中原子地增加计数字段，由调用方提交事务
+        计数变化不算记录修改，update_time保持不变
+        """
+        column = getattr(cls, name)
+        cls.query.filter(cls.id == obj_id).update({
+            column: column + amount,
+            cls.update_time: cls.update_time
+        }, synchronize_session=False)
+
 
 # 用户收藏表，建立用户与其收藏新闻多对多的关系
 tb_user_collection = db.Table(
@@ -44,6 +57,9 @@ class User(BaseModel, db.Model):
             "WOMAN"  # 女
         ),
         default="MAN")
+    followers_count = db.Column(db.Integer, default=0)  # 粉丝数量
+    following_count = db.Column(db.Integer, default=0)  # 关注的人数量
+    news_count = db.Column(db.Integer, default=0)  # 发布的新闻数量
 
     # 当前用户收藏的所有新闻
     collection_news = db.relationship("News", secondary=tb_user_collection, lazy="dynamic")  # 用户收藏的新闻
@@ -77,11 +93,27 @@ class User(BaseModel, db.Model):
             "mobile": self.mobile,
             "gender": self.gender if self.gender else "MAN",
             "signature": self.signature if self.signature else "",
-            "followers_count": self.followers.count(),
-            "news_count": self.news_list.count()
+            "followers_count": self.followers_count or 0,
+            "news_count": self.news_count or 0
         }
         return resp_dict
 
+    def to_public_dict(self):
+        """展示给其他用户的数据，不包含手机号"""
+        resp_dict = self.to_dict()
+        resp_dict.pop("mobile")
+        return resp_dict
+
+    @classmethod
+    def serialize_many(cls, users, public=False):
+        """
+        批量序列化用户，结果与to_dict一致，public为True时与to_public_dict一致
+        粉丝数和发布新闻数读取计数字段，不需要额外查询
+        """
+        if public:
+            return [user.to_public_dict() for user in users]
+        return [user.to_dict() for user in users]
+
     def to_admin_dict(self):
         resp_dict = {
             "id": self.id,
@@ -108,9 +140,30 @@ class News(BaseModel, db.Model):
     user_id = db.Column(db.Integer, db.ForeignKey("info_user.id"))  # 当前新闻的作者id
     status = db.Column(db.Integer, default=0)  # 当前新闻状态 如果为0代表审核通过，1代表审核中，-1代表审核不通过
     reason = db.Column(db.String(256))  # 未通过原因，status = -1 的时候使用
+    comments_count = db.Column(db.Integer, default=0)  # 评论数量
     # 当前新闻的所有评论
     comments = db.relationship("Comment", lazy="dynamic")
 
+    # to_dict返回的全部字段
+    DICT_FIELDS = ("id", "title", "source", "digest", "create_time", "content", "comments_count",
+                   "clicks", "category", "index_image_url", "author")
+    # to_basic_dict返回的字段
+    BASIC_FIELDS = ("id", "title", "source", "digest", "create_time", "index_image_url", "clicks")
+    # 首页新闻列表默认返回的字段
+    FEED_FIELDS = ("id", "title", "source", "digest", "create_time", "index_image_url")
+    # 字段对应的列，未列出的字段与列同名
+    FIELD_COLUMNS = {"category": "category_id", "author": "user_id"}
+
+    @classmethod
+    def load_fields(cls, fields):
+        """
+        查询选项，只加载序列化指定字段需要的列，不加载content等不需要的大字段
+        id、create_time用于排序和游标，category_id、user_id用于批量查询分类和作者，总是加载
+        """
+        columns = set(cls.FIELD_COLUMNS.get(field, field) for field in fields)
+        columns.update(("id", "create_time", "category_id", "user_id"))
+        return load_only(*[getattr(cls, column) for column in columns])
+
     def to_review_dict(self):
         resp_dict = {
             "id": self.id,
@@ -141,14 +194,56 @@ class News(BaseModel, db.Model):
             "digest": self.digest,
             "create_time": self.create_time.strftime("%Y-%m-%d %H:%M:%S"),
             "content": self.content,
-            "comments_count": self.comments.count(),
+            "comments_count": self.comments_count or 0,
             "clicks": self.clicks,
             "category": self.category.to_dict(),
             "index_image_url": self.index_image_url,
-            "author": self.user.to_dict() if self.user else None
+            "author": self.user.to_public_dict() if self.user else None
         }
         return resp_dict
 
+    @classmethod
+    def serialize_many(cls, news_list, fields=None):
+        """
+        批量序列化新闻列表，结果与to_dict一致
+        分类、作者按整页新闻查询，评论数、粉丝数等统计数据读取计数字段，
+        查询次数与新闻数量无关
+
+        :param news_list: 新闻对象列表
+        :param fields: 需要返回的字段，默认为to_dict的全部字段
+        :return: 新闻字典列表
+        """
+        fields = set(fields) if fields else set(cls.DICT_FIELDS)
+        categories = {}
+        category_ids = set(news.category_id for news in news_list if news.category_id)
+        if "category" in fields and category_ids:
+            for category in Category.query.filter(Category.id.in_(category_ids)).all():
+                categories[category.id] = category.to_dict()
+        authors = {}
+        user_ids = set(news.user_id for news in news_list if news.user_id)
+        if "author" in fields and user_ids:
+            for author in User.serialize_many(User.query.filter(User.id.in_(user_ids)).all(), public=True):
+                authors[author["id"]] = author
+
+        resp_list = []
+        for news in news_list:
+            resp_dict = {}
+            for field in cls.DICT_FIELDS:
+                if field not in fields:
+                    continue
+                if field == "create_time":
+                    resp_dict[field] = news.create_time.strftime("%Y-%m-%d %H:%M:%S")
+                elif field == "comments_count":
+                    resp_dict[field] = news.comments_count or 0
+                elif field == "category":
+                    resp_dict[field] = categories.get(news.category_id)
+                elif field == "author":
+                    resp_dict[field] = authors.get(news.user_id)
+                else:
+                    resp_dict[field] = getattr(news, field)
+            resp_list.append(resp_dict)
+        return resp_list
+
 
 class Comment(BaseModel, db.Model):
     """评论"""
@@ -168,12 +263,83 @@ class Comment(BaseModel, db.Model):
             "create_time": self.create_time.strftime("%Y-%m-%d %H:%M:%S"),
             "content": self.content,
             "parent": self.parent.to_dict() if self.parent else None,
-            "user": User.query.get(self.user_id).to_dict(),
+            "user": User.query.get(self.user_id).to_public_dict(),
             "news_id": self.news_id,
             "like_count": self.like_count
         }
         return resp_dict
 
+    @classmethod
+    def serialize_many(cls, comments, user_id=None):
+        """
+        批量序列化评论，结果与to_dict一致，并补充当前用户是否点赞is_like
+        评论作者使用to_public_dict，不返回手机号
+        1、查询不在列表中的父评论(通常父评论属于同一条新闻，不需要额外查询)
+        2、一次查询所有评论作者，作者的统计数据按批分组查询
+        3、一次查询当前用户对这些评论的点赞记录
+        4、在内存中组装评论和父评论
+
+        :param comments: 评论对象列表
+        :param user_id: 当前登录用户id，未登录为None
+        :return: 评论字典列表
+        """
+        comment_map = dict((comment.id, comment) for comment in comments)
+        # 加载缺失的父评论，直到所有祖先评论都在内存中
+        missing_ids = set(comment.parent_id for comment in comments
+                          if comment.parent_id and comment.parent_id not in comment_map)
+        while missing_ids:
+            parents = cls.query.filter(cls.id.in_(missing_ids)).all()
+            if not parents:
+                break
+            for parent in parents:
+                comment_map[parent.id] = parent
+            missing_ids = set(parent.parent_id for parent in parents
+                              if parent.parent_id and parent.parent_id not in comment_map)
+
+        authors = {}
+        user_ids = set(comment.user_id for comment in comment_map.values())
+        if user_ids:
+            for author in User.serialize_many(User.query.filter(User.id.in_(user_ids)).all(), public=True):
+                authors[author["id"]] = author
+
+        like_ids = set()
+        if user_id and comments:
+            like_ids = set(row.comment_id for row in CommentLike.query.filter(
+                CommentLike.comment_id.in_([comment.id for comment in comments]),
+                CommentLike.user_id == user_id).all())
+
+        comment_dicts = {}
+
+        def serialize(comment):
+            if comment.id not in comment_dicts:
+                parent = comment_map.get(comment.parent_id) if comment.parent_id else None
+                comment_dicts[comment.id] = {
+                    "id": comment.id,
+                    "create_time": comment.create_time.strftime("%Y-%m-%d %H:%M:%S"),
+                    "content": comment.content,
+                    "parent": serialize(parent) if parent else None,
+                    "user": authors.get(comment.user_id),
+                    "news_id": comment.news_id,
+                    "like_count": comment.like_count
+                }
+            return comment_dicts[comment.id]
+
+        resp_list = []
+        for comment in comments:
+            comment_dict = dict(serialize(comment))
+            comment_dict["is_like"] = comment.id in like_ids
+            resp_list.append(comment_dict)
+        return resp_list
+
+    @classmethod
+    def load_thread(cls, news_id, user_id=None):
+        """
+        加载新闻的全部评论，按评论时间倒序
+        查询次数固定，与评论数量无关
+        """
+        comments = cls.query.filter(cls.news_id == news_id).order_by(cls.create_time.desc()).all()
+        return cls.serialize_many(comments, user_id)
+
 
 class CommentLike(BaseModel, db.Model):
     """评论点赞"""
@@ -182,6 +348,12 @@ class CommentLike(BaseModel, db.Model):
     user_id = db.Column("user_id", db.Integer, db.ForeignKey("info_user.id"), primary_key=True)  # 用户编号
 
 
+class ClickFlush(BaseModel, db.Model):
+    """已写回的新闻点击量批次，和点击量在同一个事务中写入，保证同一批次只写回一次"""
+    __tablename__ = "info_click_flush"
+    id = db.Column(db.String(64), primary_key=True)  # 批次编号，写回编号:批次序号
+
+
 class Category(BaseModel, db.Model):
     """新闻分类"""
     __tablename__ = "info_category"
@@ -6,6 +6,17 @@ from info import constants, db
 from info.models import User, News, Category
 from info.utils.commons import login_required
 from info.utils.image_storage import storage
+from info.utils.click_rank import add_click_rank, remove_click_rank
+from info.utils.news_cache import delete_news_cache, get_news_cache_stats
+from info.utils.news_feed import refresh_latest_news
+from info.utils.category_cache import get_categories, bump_category_version, get_category_version
+from info.utils.search import index_news
+from info.utils.suggest import add_suggest
+from info.utils.trending import remove_trending, move_trending
+from info.utils.timeline import fanout_news
+from info.utils.related import mark_related_pending
+from info.utils.unique_viewers import get_unique_viewers
+from info.utils.conditional import conditional
 from info.utils.response_code import RET
 from . import admin_blue
 
@@ -318,6 +329,21 @@ def news_review_action():
         current_app.logger.error(e)
         db.session.rollback()
         return jsonify(errno=RET.DBERR,errmsg='保存数据失败')
+    # 同步点击排行、新闻缓存和首页最新新闻列表
+    if news.status == 0:
+        add_click_rank(news.id, news.clicks)
+    else:
+        remove_click_rank(news.id)
+        remove_trending(news.id, news.category_id)
+    delete_news_cache(news.id)
+    refresh_latest_news(news.category_id)
+    # 审核通过建立搜索索引和搜索提示，不通过从索引中删除
+    index_news(news)
+    add_suggest(news)
+    # 推送到作者粉丝的关注时间线
+    fanout_news(news)
+    # 等待下次任务计算相关新闻
+    mark_related_pending(news.id)
 
     return jsonify(errno=RET.OK, errmsg="OK")
 
@@ -367,6 +393,50 @@ def news_edit():
 
 
 
+@admin_blue.route('/news_viewers')
+def news_viewers():
+    """
+    新闻独立访客统计
+    1、获取参数，页数p，默认1
+    2、查询审核通过的新闻，按点击量排序，分页
+    3、批量获取当前页新闻今日、本周、本月的独立访客数量
+    4、返回模板admin/news_viewers.html
+
+    :return:
+    """
+    page = request.args.get('p','1')
+    try:
+        page = int(page)
+    except Exception as e:
+        current_app.logger.error(e)
+        page = 1
+    news_list = []
+    current_page = 1
+    total_page = 1
+    try:
+        paginate = News.query.filter(News.status == 0).order_by(News.clicks.desc())\
+            .paginate(page,constants.ADMIN_NEWS_PAGE_MAX_COUNT,False)
+        news_list = paginate.items
+        current_page = paginate.page
+        total_page = paginate.pages
+    except Exception as e:
+        current_app.logger.error(e)
+    news_dict_list = [news.to_basic_dict() for news in news_list]
+    try:
+        viewers = get_unique_viewers([news['id'] for news in news_dict_list])
+    except Exception as e:
+        current_app.logger.error(e)
+        viewers = {}
+    for news in news_dict_list:
+        news['viewers'] = viewers.get(news['id'], {})
+    data = {
+        'total_page':total_page,
+        'current_page':current_page,
+        'news_list':news_dict_list
+    }
+    return render_template('admin/news_viewers.html',data=data)
+
+
 @admin_blue.route('/news_edit_detail',methods=['GET','POST'])
 def news_edit_detail():
     """
@@ -403,15 +473,14 @@ def news_edit_detail():
         if not news:
             return render_template('admin/news_edit_detail.html',errmsg='未查询到数据')
         try:
-            categories = Category.query.all()
+            categories = get_categories()
         except Exception as e:
             current_app.logger.error(e)
             return render_template('admin/news_edit_detail.html',errmsg='查询分类数据错误')
         category_dict_list = []
         # 遍历分类数据，需要判断当前遍历到的分类和新闻所属分类一致
-        for category in categories:
-            cate_dict = category.to_dict()
-            if category.id == news.category_id:
+        for cate_dict in categories:
+            if cate_dict['id'] == news.category_id:
                 cate_dict['is_selected'] = True
             category_dict_list.append(cate_dict)
         category_dict_list.pop(0)
@@ -444,6 +513,8 @@ def news_edit_detail():
             current_app.logger.error(e)
             return jsonify(errno=RET.THIRDERR,errmsg='上传图片失败')
         news.image_url = constants.QINIU_DOMIN_PREFIX + image_name
+    # 记录修改前的分类，用于刷新首页最新新闻列表
+    old_category_id = news.category_id
     news.title = title
     news.digest = digest
     news.content = content
@@ -456,11 +527,21 @@ def news_edit_detail():
         current_app.logger.error(e)
         db.session.rollback()
         return jsonify(errno=RET.DBERR,errmsg='保存数据失败')
+    # 标题、摘要可能被修改，删除缓存的新闻数据，重新计算相关新闻
+    delete_news_cache(news.id)
+    mark_related_pending(news.id)
+    # 分类可能被修改，刷新修改前后分类的最新新闻列表
+    if news.status == 0:
+        refresh_latest_news(old_category_id, news.category_id)
+        index_news(news)
+        add_suggest(news)
+        move_trending(news.id, old_category_id, news.category_id)
     return jsonify(errno=RET.OK,errmsg='OK')
 
 
 
 @admin_blue.route('/news_type',methods=['GET','POST'])
+@conditional(get_category_version)
 def news_type():
     """
     新闻分类
@@ -476,13 +557,10 @@ def news_type():
     """
     if request.method == 'GET':
         try:
-            categories = Category.query.all()
+            categories_dict_list = get_categories()
         except Exception as e:
             current_app.logger.error(e)
             return render_template('admin/news_type.html',errmsg='查询数据错误')
-        categories_dict_list = []
-        for category in categories:
-            categories_dict_list.append(category.to_dict())
         categories_dict_list.pop(0)
         data = {
             'categories':categories_dict_list
@@ -511,12 +589,17 @@ def news_type():
     except Exception as e:
         current_app.logger.error(e)
         return jsonify(errno=RET.DBERR,errmsg='保存数据失败')
+    # 分类数据变化，增加分类版本号，所有进程重新加载分类
+    bump_category_version()
     return jsonify(errno=RET.OK,errmsg='OK')
 
 
+@admin_blue.route('/cache_stats')
+def cache_stats():
+    """
+    新闻缓存统计
+    返回当前进程的进程内缓存和redis缓存的命中、未命中、淘汰次数，用于调整缓存大小
 
-
-
-
-
-
+    :return:
+    """
+    return jsonify(errno=RET.OK,errmsg='OK',data=get_news_cache_stats())
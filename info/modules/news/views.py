@@ -1,17 +1,67 @@
+import json
+
 # 导入flask内置的模块
-from flask import session, render_template, current_app, jsonify, request, g
+from flask import session, render_template, current_app, jsonify, request, g, make_response, Response, \
+    stream_with_context, abort
 # 从news/__init__文件中导入蓝图对象
 from info.utils.response_code import RET
 from . import news_blue
 # 导入User模型类
 from info.models import User, Category, News, Comment, CommentLike
 # 导入常量文件
-from info import constants,db
+from info import constants,db,redis_store
 # 导入登录验证装饰器
-from info.utils.commons import login_required
+from info.utils.commons import login_required, load_login_user
+# 导入点击排行
+from info.utils.click_rank import get_click_rank_list, incr_click_rank
+# 导入点击量计数
+from info.utils.click_counter import incr_news_clicks, get_pending_clicks
+# 导入游标分页
+from info.utils.cursor import decode_cursor, paginate_by_cursor
+# 导入新闻分类缓存
+from info.utils.category_cache import get_categories, get_category_version
+# 导入页面缓存
+from info.utils.page_cache import get_or_render
+# 导入新闻缓存
+from info.utils.news_cache import get_news_many, delete_news_cache, get_news_version
+# 导入收藏、关注关系判断
+from info.utils.membership import is_collected as is_news_collected, is_following
+# 导入评论点赞
+from info.utils.comment_like import apply_like_states, get_like_states
+# 导入新闻搜索
+from info.utils.search import search_news
+# 导入搜索提示
+from info.utils.suggest import get_suggestions
+# 导入热门新闻
+from info.utils.trending import record_trending, get_trending
+# 导入关注时间线
+from info.utils.timeline import get_timeline
+# 导入相关新闻
+from info.utils.related import get_related_ids
+# 导入独立访客统计
+from info.utils.unique_viewers import record_viewer
+# 导入实时评论推送
+from info.utils.live import publish_comment, stream_events
+# 导入条件请求
+from info.utils.conditional import conditional, user_part, time_bucket, timestamp_to_datetime
+# 导入首页最新新闻列表
+from info.utils.news_feed import get_latest_news_page, get_latest_news_by_cursor, get_latest_updated
+# 导入收藏、点赞、关注操作
+from info.utils.actions import ActionError, run_action, collect_news, like_comment, follow_user
+# 导入发布后的静态文件
+from info.utils.assets import send_asset
+
+
+def index_version():
+    """首页的版本号：分类版本号、当前用户，点击排行按页面缓存有效期刷新"""
+    category_version = get_category_version()
+    if category_version is None:
+        return None
+    return '%s|%s|%s' % (category_version, user_part(), time_bucket(constants.PAGE_CACHE_EXPIRES))
 
 
 @news_blue.route('/')
+@conditional(index_version)
 @login_required
 def index():
     """
@@ -26,6 +76,9 @@ def index():
         三、点击排行
         1、查询mysql，获取新闻点击排行
         按点击量展示6条新闻
+        四、页面缓存
+        1、未登录用户返回缓存的整页html
+        2、已登录用户的点击排行和新闻分类使用缓存的html片段
 
     :return:
     """
@@ -42,46 +95,77 @@ def index():
 
     user = g.user
 
-    # 新闻分类数据加载
+    # 新闻分类数据加载，读取进程内缓存的分类数据
     try:
-        categories = Category.query.all()
+        category_list = get_categories()
     except Exception as e:
         current_app.logger.error(e)
         return jsonify(errno=RET.DBERR,errmsg='查询新闻分类数据失败')
     # 判断查询结果
-    if not categories:
+    if not category_list:
         return jsonify(errno=RET.NODATA,errmsg='无新闻分类数据')
-    # 定义列表，用来存储遍历后的新闻分类数据
-    category_list = []
-    # 遍历查询结果，调用模型类中to_dict函数，获取数据
-    for category in categories:
-        category_list.append(category.to_dict())
 
-    # 查询新闻点击排行
+    # 未登录用户看到的首页完全相同，返回缓存的整页html
+    if not user:
+        def render_index():
+            data = {
+                'user_info':None,
+                'category_list':category_list,
+                'news_click_list':get_click_rank_list()
+            }
+            return render_template('news/index.html',data=data)
+        try:
+            return get_or_render('page_index', constants.PAGE_CACHE_EXPIRES, render_index)
+        except Exception as e:
+            current_app.logger.error(e)
+            return jsonify(errno=RET.DBERR,errmsg='查询新闻点击排行数据失败')
+
+    # 已登录用户只渲染用户信息，点击排行和新闻分类使用缓存的html片段
     try:
-        news_list = News.query.order_by(News.clicks.desc()).limit(constants.CLICK_RANK_MAX_NEWS)
+        click_rank_html = get_click_rank_html()
     except Exception as e:
         current_app.logger.error(e)
         return jsonify(errno=RET.DBERR,errmsg='查询新闻点击排行数据失败')
-    # 判断查询结果
-    if not news_list:
-        return jsonify(errno=RET.NODATA,errmsg='无新闻点击排行数据')
-    # 定义列表，存储查询结果
-    news_click_list = []
-    for news in news_list:
-        news_click_list.append(news.to_dict())
-
-
+    category_html = get_or_render('fragment_category_%s' % get_category_version(), constants.FRAGMENT_CACHE_EXPIRES,
+                                  lambda: render_template('news/category_list.html',data={'category_list':category_list}))
 
     # 定义字典，用来存储返回给模板的数据
     data = {
-        'user_info':user.to_dict() if user else None,
+        'user_info':user.to_dict(),
         'category_list':category_list,
-        'news_click_list':news_click_list
+        'category_html':category_html,
+        'click_rank_html':click_rank_html
     }
     return render_template('news/index.html',data=data)
 
+
+def get_click_rank_html():
+    """获取缓存的点击排行html片段"""
+    return get_or_render('fragment_click_rank', constants.FRAGMENT_CACHE_EXPIRES,
+                         lambda: render_template('news/click_rank.html',data={'news_click_list':get_click_rank_list()}))
+
+def news_list_version():
+    """
+    新闻列表的版本号：分类最新新闻列表的刷新时间，新闻审核、编辑时刷新
+    返回分类字段时加上分类版本号；点击量、评论数、作者等字段随时变化，不使用条件请求
+    """
+    fields = request.args.get('fields')
+    fields = set(fields.split(',')) if fields else set(News.FEED_FIELDS)
+    if fields & {'clicks', 'comments_count', 'author'}:
+        return None
+    try:
+        cid = int(request.args.get('cid', '1'))
+    except ValueError:
+        return None
+    updated = get_latest_updated(cid)
+    if updated is None:
+        return None
+    version = '%s|%s' % (updated, get_category_version() if 'category' in fields else '')
+    return version, timestamp_to_datetime(updated)
+
+
 @news_blue.route("/news_list")
+@conditional(news_list_version)
 def get_news_list():
     """
     首页新闻列表
@@ -96,6 +180,14 @@ def get_news_list():
     4、获取分页后的新闻列表、总页数、当前页数
     5、定义容器，遍历新闻列表
     6、返回总页数、当前页数、新闻列表
+    前几页直接读取redis中缓存的最新新闻id，超出缓存范围时才查询mysql
+
+    fields参数：逗号分隔的返回字段，默认只返回首页列表展示的字段，
+    查询mysql时只加载这些字段需要的列，不需要作者、分类时不查询
+
+    游标模式：传入cursor参数(第一页传空字符串)，按(create_time, id)定位下一页，
+    不使用offset和count(*)，返回next_cursor，没有下一页时为null；
+    传入total=1时，额外返回redis中缓存的近似总页数
 
     :return:
     """
@@ -103,21 +195,76 @@ def get_news_list():
     cid = request.args.get('cid','1')
     page = request.args.get('page','1')
     per_page = request.args.get('per_page','10')
+    cursor = request.args.get('cursor')
+    fields = request.args.get('fields')
     # 转换数据类型
     try:
         cid,page,per_page = int(cid),int(page),int(per_page)
+        if cursor is not None:
+            cursor = decode_cursor(cursor)
     except Exception as e:
         current_app.logger.error(e)
         return jsonify(errno=RET.PARAMERR,errmsg='参数类型错误')
-    filters = []
+    # 检查页码和每页数量的范围，per_page为0时无法计算总页数
+    if page < 1 or per_page < 1 or per_page > constants.NEWS_LIST_PER_PAGE_MAX:
+        return jsonify(errno=RET.PARAMERR,errmsg='参数范围错误')
+    # 检查返回字段，id总是返回
+    fields = set(fields.split(',') if fields else News.FEED_FIELDS) | {'id'}
+    if not fields <= set(News.DICT_FIELDS):
+        return jsonify(errno=RET.PARAMERR,errmsg='参数范围错误')
+    # 字段都在基本字段中时读取基本数据的缓存，否则读取详情数据的缓存
+    kind = 'basic' if fields <= set(News.BASIC_FIELDS) else 'detail'
+    # 只展示审核通过的新闻
+    filters = [News.status == 0]
     # 判断新闻分类，如果不是最新，添加到过滤条件的列表中。
     if cid > 1:
         filters.append(News.category_id == cid)
+    # 游标模式
+    if 'cursor' in request.args:
+        try:
+            # 优先从redis的最新新闻列表中读取
+            result = get_latest_news_by_cursor(cid, cursor, per_page, kind)
+            if result:
+                news_dict_list, next_cursor = result
+            else:
+                query = News.query.options(News.load_fields(fields)).filter(*filters)
+                news_list, next_cursor = paginate_by_cursor(query, News, cursor, per_page)
+                news_dict_list = News.serialize_many(news_list, fields)
+        except Exception as e:
+            current_app.logger.error(e)
+            return jsonify(errno=RET.DBERR,errmsg='查询新闻列表数据失败')
+        data = {
+            'news_dict_list':pick_fields(news_dict_list, fields),
+            'next_cursor':next_cursor
+        }
+        if request.args.get('total') == '1':
+            data['total_page'] = get_news_total_page(cid, filters, per_page)
+        return jsonify(errno=RET.OK,errmsg='OK',data=data)
+    # 前几页优先从redis的最新新闻列表中读取
+    try:
+        result = get_latest_news_page(cid, page, per_page, kind)
+    except Exception as e:
+        current_app.logger.error(e)
+        return jsonify(errno=RET.DBERR,errmsg='查询新闻列表数据失败')
+    if result:
+        news_dict_list, total = result
+        # 缓存未满时，缓存的数量就是新闻总数
+        if total < constants.NEWS_LATEST_MAX:
+            total_page = (total + per_page - 1) // per_page
+        else:
+            total_page = get_news_total_page(cid, filters, per_page)
+        data = {
+            'news_dict_list':pick_fields(news_dict_list, fields),
+            'current_page':page,
+            'total_page':total_page
+        }
+        return jsonify(errno=RET.OK,errmsg='OK',data=data)
     # 根据filters过滤条件查询mysql
     try:
         # *filters是python语法中的拆包。
         # paginate = News.query.filter(News.category_id == cid).order_by(News.create_time.desc()).paginate(page,per_page,False)
-        paginate = News.query.filter(*filters).order_by(News.create_time.desc()).paginate(page,per_page,False)
+        paginate = News.query.options(News.load_fields(fields)).filter(*filters)\
+            .order_by(News.create_time.desc()).paginate(page,per_page,False)
     except Exception as e:
         current_app.logger.error(e)
         return jsonify(errno=RET.DBERR,errmsg='查询新闻列表数据失败')
@@ -125,10 +272,12 @@ def get_news_list():
     news_list = paginate.items # 新闻数据
     current_page = paginate.page # 当前页数
     total_page = paginate.pages # 总页数
-    # 定义容器，存储分页的新闻列表数据
-    news_dict_list = []
-    for news in news_list:
-        news_dict_list.append(news.to_dict())
+    # 序列化分页的新闻列表数据，只返回请求的字段
+    try:
+        news_dict_list = News.serialize_many(news_list, fields)
+    except Exception as e:
+        current_app.logger.error(e)
+        return jsonify(errno=RET.DBERR,errmsg='查询新闻列表数据失败')
     # 定义字典
     data = {
         'news_dict_list':news_dict_list,
@@ -139,178 +288,431 @@ def get_news_list():
     return jsonify(errno=RET.OK,errmsg='OK',data=data)
 
 
+def pick_fields(news_dict_list, fields):
+    """缓存中的新闻字典包含全部字段，只保留请求的字段"""
+    return [dict((field, news[field]) for field in fields if field in news) for news in news_dict_list]
+
+
+def get_news_total_page(cid, filters, per_page):
+    """
+    获取新闻列表的近似总页数
+    新闻总数在redis中缓存，过期后才重新count
+
+    :return: 总页数，查询失败或per_page不是正数时返回None
+    """
+    if per_page < 1:
+        return None
+    key = 'news_count_%d' % cid
+    try:
+        count = redis_store.get(key)
+        if count is None:
+            count = News.query.filter(*filters).count()
+            redis_store.setex(key, constants.NEWS_COUNT_REDIS_EXPIRES, count)
+    except Exception as e:
+        current_app.logger.error(e)
+        return None
+    return (int(count) + per_page - 1) // per_page
+
+
+def record_news_view(news_id):
+    """
+    记录新闻浏览：点击量、独立访客、点击排行和热门新闻，只修改redis
+    详情页返回304时也需要记录
+    """
+    try:
+        news_dict_list = get_news_many([news_id], 'detail')
+    except Exception as e:
+        current_app.logger.error(e)
+        return
+    if not news_dict_list:
+        return
+    news_dict = news_dict_list[0]
+    user_id = session.get('user_id')
+    # 新闻点击次数加1，只在redis中累加，由写回任务批量保存到mysql
+    incr_news_clicks(news_id)
+    # 记录独立访客，登录用户按用户id去重，未登录用户按ip地址去重
+    record_viewer(news_id, 'user:%d' % user_id if user_id else 'ip:%s' % request.remote_addr)
+    # 同步更新redis中的点击排行和热门新闻
+    if news_dict['status'] == 0:
+        incr_click_rank(news_id)
+        record_trending(news_id, (news_dict['category'] or {}).get('id'), 'view')
+
+
+def news_detail_version(news_id):
+    """
+    详情页的版本号：新闻版本号，新闻被修改、评论、收藏、评论点赞时变化
+    点击排行、相关新闻按片段缓存有效期刷新；非外壳模式的页面包含当前用户的数据和关注状态的版本号
+    """
+    version = get_news_version(news_id)
+    if version is None:
+        return None
+    if current_app.config.get('NEWS_DETAIL_SHELL'):
+        return '%s|%s' % (version, time_bucket())
+    return '%s|%s|%s' % (version, time_bucket(), user_part())
+
+
 @news_blue.route('/<int:news_id>')
-@login_required
+@conditional(news_detail_version, always=record_news_view)
 def get_news_detail(news_id):
     """
     新闻详情
+    外壳模式(NEWS_DETAIL_SHELL)下，所有用户共用同一份页面，按新闻版本号缓存渲染好的html，
+    响应带有Cache-Control和ETag，可以被浏览器和CDN缓存，请求过程中不查询mysql；
+    登录用户、收藏、关注、点赞状态由页面请求/news/<id>/viewer_state获取
+    浏览量等统计由record_news_view记录，返回304时也会记录
     :param news_id:
     :return:
     """
-    user = g.user
-    # 使用请求上下文对象，获取user_id
-    # user_id = session.get('user_id')
-    # user = None
-    # # 查询mysql，获取用户信息
-    # try:
-    #     # User.query.filter_by(id=user_id).first()
-    #     # User.query.filter(User.id==user_id).first()
-    #     user = User.query.get(user_id)
-    # except Exception as e:
-    #     current_app.logger.error(e)
+    shell = current_app.config.get('NEWS_DETAIL_SHELL')
+    # 外壳模式不查询登录用户
+    user = None if shell else load_login_user()
 
-    # 查询新闻点击排行
+    # 根据新闻id获取新闻详情，优先读取进程内缓存和redis缓存
     try:
-        news_list = News.query.order_by(News.clicks.desc()).limit(constants.CLICK_RANK_MAX_NEWS)
+        news_dict_list = get_news_many([news_id], 'detail')
     except Exception as e:
         current_app.logger.error(e)
-        return jsonify(errno=RET.DBERR, errmsg='查询新闻点击排行数据失败')
+        return jsonify(errno=RET.DBERR,errmsg='查询新闻详情数据失败')
     # 判断查询结果
-    if not news_list:
-        return jsonify(errno=RET.NODATA, errmsg='无新闻点击排行数据')
-    # 定义列表，存储查询结果
-    news_click_list = []
-    for news in news_list:
-        news_click_list.append(news.to_dict())
-
-    # 根据新闻id查询具体的新闻
+    if not news_dict_list:
+        return jsonify(errno=RET.NODATA,errmsg='无新闻详情数据')
+    news_dict = news_dict_list[0]
+
+    if not shell:
+        return render_news_detail(news_dict, user)
+
+    # 新闻被修改、有新评论时版本号变化，重新渲染
+    version = get_news_version(news_id)
     try:
-        news = News.query.get(news_id)
+        if version is None:
+            html = render_news_detail(news_dict, None)
+        else:
+            html = get_or_render('page_news_%d_%d' % (news_id, version), constants.NEWS_SHELL_CACHE_EXPIRES,
+                                 lambda: render_news_detail(news_dict, None))
     except Exception as e:
         current_app.logger.error(e)
         return jsonify(errno=RET.DBERR,errmsg='查询新闻详情数据失败')
-    # 判断查询结果
-    if not news:
-        return jsonify(errno=RET.NODATA,errmsg='无新闻详情数据')
+    # ETag由条件请求装饰器设置
+    response = make_response(html)
+    # session不为空时，响应会带上session的cookie，只允许浏览器缓存，避免CDN把cookie返回给其他用户
+    if session:
+        response.cache_control.private = True
+    else:
+        response.cache_control.public = True
+    response.cache_control.max_age = constants.NEWS_SHELL_CACHE_EXPIRES
+    return response
+
 
-    # 新闻点击次数加1
-    news.clicks += 1
-    # 提交数据
+def render_news_detail(news_dict, user):
+    """
+    渲染新闻详情页
+    user为None时渲染所有用户共用的页面，不包含收藏、关注、点赞状态
+    """
+    news_id = news_dict['id']
+    # 新闻点击排行，使用缓存的html片段
     try:
-        db.session.add(news)
-        db.session.commit()
+        click_rank_html = get_click_rank_html()
     except Exception as e:
         current_app.logger.error(e)
-        db.session.rollback()
-        return jsonify(errno=RET.DBERR,errmsg='保存数据失败')
-
+        click_rank_html = None
 
-    # 评论
-    comments = []
+    # 评论只加载第一页，后续页面由评论接口按游标加载
+    comment_dict_li = []
+    comments_next_cursor = None
     try:
-        comments = Comment.query.filter(Comment.news_id == news_id).order_by(Comment.create_time.desc()).all()
+        comment_dict_li, comments_next_cursor = load_comment_page(news_id, None, constants.COMMENT_PAGE_MAX_COUNT,
+                                                                  user.id if user else None)
     except Exception as e:
         current_app.logger.error(e)
-    comment_like_ids = []
-    # 获取当前登录用户的所有评论的id，
+
+    # 是否收藏、是否关注作者的标记
+    is_collected = False
+    is_followed = False
     if user:
         try:
-            comment_ids = [comment.id for comment in comments]
-            # 再查询点赞了哪些评论
-            comment_likes = CommentLike.query.filter(CommentLike.comment_id.in_(comment_ids),
-                                                     CommentLike.user_id == g.user.id).all()
-            # 遍历点赞的评论数据,获取
-            comment_like_ids = [comment_like.comment_id for comment_like in comment_likes]
+            is_collected = is_news_collected(user.id, news_id)
+            if news_dict['author']:
+                is_followed = is_following(user.id, news_dict['author']['id'])
         except Exception as e:
             current_app.logger.error(e)
-    comment_dict_li = []
-    for comment in comments:
-        comment_dict = comment.to_dict()
-        # 如果未点赞
-        comment_dict['is_like'] = False
-        # 如果点赞
-        if comment.id in comment_like_ids:
-            comment_dict['is_list'] = True
-        comment_dict_li.append(comment_dict)
 
+    # 展示的点击量 = mysql中已保存的点击量 + redis中尚未写回的增量
+    news_dict['clicks'] = (news_dict['clicks'] or 0) + get_pending_clicks([news_id])[news_id]
 
-
-    # 是否收藏的标记
-    is_collected = False
-    if user and news in user.collection_news:
-        is_collected = True
+    # 相关新闻由离线任务计算，只需要读取一次redis
+    related_news = []
+    try:
+        related_news = get_news_many(get_related_ids(news_id))
+    except Exception as e:
+        current_app.logger.error(e)
 
     data = {
         'user_info': user.to_dict() if user else None,
-        'news_click_list': news_click_list,
-        'news_detail':news.to_dict(),
-        'is_collected':is_collected
+        'click_rank_html': click_rank_html,
+        'news_detail':news_dict,
+        'is_collected':is_collected,
+        'is_followed':is_followed,
+        'comments':comment_dict_li,
+        'comments_next_cursor':comments_next_cursor,
+        'related_news':related_news,
+        'shell':current_app.config.get('NEWS_DETAIL_SHELL')
     }
 
     # 渲染模板
     return render_template('news/detail.html',data=data)
 
-@news_blue.route('/news_collect',methods=['POST'])
+
+def load_comment_page(news_id, cursor, limit, user_id):
+    """
+    按游标加载一页评论，评论的父评论、作者批量加载，点赞数据一次pipeline读取
+
+    :return: (评论字典列表, 下一页游标)
+    """
+    comments, next_cursor = paginate_by_cursor(Comment.query.filter(Comment.news_id == news_id),
+                                               Comment, cursor, limit)
+    # 点赞数量和当前用户的点赞状态以redis中的数据为准
+    comment_dict_list = apply_like_states(Comment.serialize_many(comments), user_id)
+    return comment_dict_list, next_cursor
+
+
+@news_blue.route('/news/<int:news_id>/viewer_state')
 @login_required
-def news_collection():
+def news_viewer_state(news_id):
+    """
+    新闻详情页的个性化数据，配合外壳模式使用
+    1、获取参数，页面上评论的id列表comment_ids(逗号分隔)
+    2、未登录时只返回评论的点赞数量
+    3、登录时返回用户信息、是否收藏、是否关注作者、点赞过的评论id
+    4、收藏、关注、点赞状态都优先读取redis中缓存的集合
+    5、响应不允许被缓存
+
+    :return:
+    """
+    user = g.user
+    comment_ids = request.args.get('comment_ids')
+    try:
+        comment_ids = [int(comment_id) for comment_id in comment_ids.split(',')] if comment_ids else []
+    except Exception as e:
+        current_app.logger.error(e)
+        return jsonify(errno=RET.PARAMERR,errmsg='参数类型错误')
+    if len(comment_ids) > constants.COMMENT_PAGE_LIMIT_MAX:
+        return jsonify(errno=RET.PARAMERR,errmsg='参数范围错误')
+    try:
+        news_dict_list = get_news_many([news_id], 'detail')
+        if not news_dict_list:
+            return jsonify(errno=RET.NODATA,errmsg='无新闻详情数据')
+        author = news_dict_list[0]['author']
+        like_counts, like_ids = get_like_states(comment_ids, user.id if user else None)
+        is_collected = is_news_collected(user.id, news_id) if user else False
+        is_followed = is_following(user.id, author['id']) if user and author else False
+    except Exception as e:
+        current_app.logger.error(e)
+        return jsonify(errno=RET.DBERR,errmsg='查询数据失败')
+    data = {
+        'user_info':user.to_dict() if user else None,
+        'is_collected':is_collected,
+        'is_followed':is_followed,
+        'like_ids':sorted(like_ids),
+        'like_counts':like_counts
+    }
+    response = jsonify(errno=RET.OK,errmsg='OK',data=data)
+    response.cache_control.private = True
+    response.cache_control.no_store = True
+    return response
+
+
+@news_blue.route('/news/<int:news_id>/stream')
+def news_stream(news_id):
     """
-        用户收藏或取消收藏
-        1、判断用户是否登录
-        2、获取参数，news_id，action['cancel_collect','collect']
-        3、检查参数，news_id转成int类型
-        4、判断action在参数范围内
-        5、查询数据库，确认新闻存在
-        6、判断用户选择的是收藏还是取消收藏
-        7、返回结果
+    新闻的实时评论推送，Server-Sent Events
+    事件comment：新评论，数据与评论接口相同
+    事件like：评论点赞数量变化，数据为comment_id和like_count
+    长连接需要部署在协程服务器上，见live_server.py；未开启NEWS_LIVE_STREAM时返回404，
+    避免长连接占满普通服务器的工作线程
 
+    :return:
+    """
+    if not current_app.config.get('NEWS_LIVE_STREAM'):
+        abort(404)
+    response = Response(stream_with_context(stream_events(news_id)), mimetype='text/event-stream')
+    response.cache_control.no_cache = True
+    # 关闭nginx的响应缓冲，消息立即发送到客户端
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
 
-        get_json方法，作用是获取前端传入的完整的json字符串
-        params = request.get_json()
-        params.get('news_id')
-        params.get('action')
 
-        :return:
-        """
+@news_blue.route('/news/<int:news_id>/comments')
+@login_required
+def get_news_comments(news_id):
+    """
+    新闻评论列表
+    1、获取参数，cursor(第一页传空字符串或不传)，limit
+    2、检查参数，解析游标，limit转成int类型，不能超过最大数量
+    3、按(create_time, id)倒序查询一页评论
+    4、返回评论列表和下一页游标，没有下一页时为null
+
+    :param news_id:
+    :return:
+    """
     user = g.user
-    # 如果用户未登录
-    if not user:
-        return jsonify(errno=RET.SESSIONERR,errmsg='用户未登录')
-    # 获取参数
-    news_id = request.json.get('news_id')
-    action = request.json.get('action')
-    # 检查参数的完整性
-    if not all([news_id,action]):
+    cursor = request.args.get('cursor')
+    limit = request.args.get('limit', constants.COMMENT_PAGE_MAX_COUNT)
+    try:
+        cursor = decode_cursor(cursor)
+        limit = int(limit)
+    except Exception as e:
+        current_app.logger.error(e)
+        return jsonify(errno=RET.PARAMERR,errmsg='参数类型错误')
+    if limit < 1 or limit > constants.COMMENT_PAGE_LIMIT_MAX:
+        return jsonify(errno=RET.PARAMERR,errmsg='参数范围错误')
+    try:
+        comments, next_cursor = load_comment_page(news_id, cursor, limit, user.id if user else None)
+    except Exception as e:
+        current_app.logger.error(e)
+        return jsonify(errno=RET.DBERR,errmsg='查询评论数据失败')
+    data = {
+        'comments':comments,
+        'next_cursor':next_cursor
+    }
+    return jsonify(errno=RET.OK,errmsg='OK',data=data)
+
+@news_blue.route('/search')
+def search():
+    """
+    新闻搜索
+    1、获取参数，关键字q，页数page
+    2、检查参数，关键字不能为空，page转成int类型
+    3、使用倒排索引搜索，获取当前页的新闻id和结果总数
+    4、根据新闻id获取新闻数据
+    5、返回新闻列表、总页数、当前页数
+
+    :return:
+    """
+    keywords = request.args.get('q', '').strip()
+    page = request.args.get('page', '1')
+    if not keywords:
         return jsonify(errno=RET.PARAMERR,errmsg='参数缺失')
     try:
-        news_id = int(news_id)
+        page = int(page)
     except Exception as e:
         current_app.logger.error(e)
         return jsonify(errno=RET.PARAMERR,errmsg='参数类型错误')
-    # 检查action必须在范围内
-    if action not in ['collect','cancel_collect']:
+    if page < 1:
         return jsonify(errno=RET.PARAMERR,errmsg='参数范围错误')
-    # 查询新闻
     try:
-        news = News.query.get(news_id)
+        news_ids, total = search_news(keywords, page)
+        news_dict_list = get_news_many(news_ids)
     except Exception as e:
         current_app.logger.error(e)
-        return jsonify(errno=RET.DBERR,errmsg='查询新闻数据失败')
-    # 判断查询结果
-    if not news:
-        return jsonify(errno=RET.NODATA,errmsg='无新闻数据')
-    # 如果参数是收藏
-    if action == 'collect':
-        # 判断用户是否收藏过
-        if news not in user.collection_news:
-            user.collection_news.append(news)
-    else:
-        user.collection_news.remove(news)
-    # 提交数据
+        return jsonify(errno=RET.DBERR,errmsg='搜索新闻数据失败')
+    data = {
+        'news_dict_list':news_dict_list,
+        'current_page':page,
+        'total_page':(total + constants.SEARCH_PAGE_MAX_NEWS - 1) // constants.SEARCH_PAGE_MAX_NEWS
+    }
+    return jsonify(errno=RET.OK,errmsg='OK',data=data)
+
+@news_blue.route('/search/suggest')
+def search_suggest():
+    """
+    搜索提示
+    1、获取参数，关键字q
+    2、关键字为空时返回空列表
+    3、从前缀索引中获取以关键字开头的新闻标题
+    4、返回结果
+
+    :return:
+    """
+    keywords = request.args.get('q', '')
     try:
-        db.session.add(user)
-        db.session.commit()
+        suggestions = get_suggestions(keywords)
     except Exception as e:
         current_app.logger.error(e)
-        db.session.rollback()
-        return jsonify(errno=RET.DBERR,errmsg='保存数据失败')
+        return jsonify(errno=RET.DBERR,errmsg='获取搜索提示失败')
+    return jsonify(errno=RET.OK,errmsg='OK',data=suggestions)
 
-    return jsonify(errno=RET.OK,errmsg='OK')
-    
-        
+@news_blue.route('/trending')
+def trending():
+    """
+    热门新闻
+    1、获取参数，分类id列表cids(逗号分隔，默认全部分类)，每个分类的数量count
+    2、检查参数，转成int类型，count不能超过上限
+    3、一次获取全部分类的热门新闻
+    4、返回结果
+
+    :return:
+    """
+    cids = request.args.get('cids')
+    count = request.args.get('count', constants.TRENDING_MAX_COUNT)
+    try:
+        count = int(count)
+        if cids:
+            category_ids = [int(cid) for cid in cids.split(',')]
+        else:
+            category_ids = [category['id'] for category in get_categories()]
+    except Exception as e:
+        current_app.logger.error(e)
+        return jsonify(errno=RET.PARAMERR,errmsg='参数类型错误')
+    if count < 1 or count > constants.TRENDING_LIMIT_MAX:
+        return jsonify(errno=RET.PARAMERR,errmsg='参数范围错误')
+    try:
+        trending_news = get_trending(category_ids, count)
+    except Exception as e:
+        current_app.logger.error(e)
+        return jsonify(errno=RET.DBERR,errmsg='查询热门新闻数据失败')
+    data = [{'cid':cid, 'news_dict_list':trending_news[cid]} for cid in category_ids]
+    return jsonify(errno=RET.OK,errmsg='OK',data=data)
 
+@news_blue.route('/timeline')
+@login_required
+def timeline():
+    """
+    关注时间线
+    1、获取用户登录信息
+    2、获取参数，游标cursor(上一页最后一条新闻的id)，每页数量per_page
+    3、检查参数，转成int类型
+    4、读取关注的作者发布的新闻
+    5、返回新闻列表和下一页游标
 
+    :return:
+    """
+    user = g.user
+    if not user:
+        return jsonify(errno=RET.SESSIONERR,errmsg='用户未登录')
+    cursor = request.args.get('cursor')
+    per_page = request.args.get('per_page', constants.TIMELINE_PAGE_MAX_NEWS)
+    try:
+        cursor = int(cursor) if cursor else None
+        per_page = int(per_page)
+    except Exception as e:
+        current_app.logger.error(e)
+        return jsonify(errno=RET.PARAMERR,errmsg='参数类型错误')
+    if per_page < 1 or per_page > constants.TIMELINE_PAGE_MAX_NEWS:
+        return jsonify(errno=RET.PARAMERR,errmsg='参数范围错误')
+    try:
+        news_dict_list, next_cursor = get_timeline(user.id, cursor, per_page)
+    except Exception as e:
+        current_app.logger.error(e)
+        return jsonify(errno=RET.DBERR,errmsg='查询时间线数据失败')
+    data = {
+        'news_dict_list':news_dict_list,
+        'next_cursor':next_cursor
+    }
+    return jsonify(errno=RET.OK,errmsg='OK',data=data)
 
+@news_blue.route('/news_collect',methods=['POST'])
+@login_required
+def news_collection():
+    """
+    用户收藏或取消收藏
+    1、获取参数，news_id，action['cancel_collect','collect']
+    2、检查参数、修改收藏关系，见info.utils.actions.collect_news
+    3、提交数据，同步redis中缓存的数据
+    4、返回结果
 
+    :return:
+    """
+    return run_action(collect_news, g.user, request.json)
 
 
 @news_blue.route('/news_comment',methods=['POST'])
@@ -362,16 +764,24 @@ def comments_news():
     # 如果有父评论id
     if parent_id:
         comment.parent_id = parent_id
-    # 提交数据
+    # 提交数据，新闻的评论数量在同一个事务中加1
     try:
         db.session.add(comment)
+        News.incr_counter(news_id, 'comments_count')
         db.session.commit()
     except Exception as e:
         current_app.logger.error(e)
         db.session.rollback()
         return jsonify(errno=RET.DBERR,errmsg='保存数据失败')
+    # 评论数量变化，删除缓存的新闻数据
+    delete_news_cache(news_id)
+    if news.status == 0:
+        record_trending(news_id, news.category_id, 'comment')
+    # 推送给正在浏览该新闻的用户
+    comment_dict = comment.to_dict()
+    publish_comment(news_id, comment_dict)
 
-    return jsonify(errno=RET.OK,errmsg='OK',data=comment.to_dict())
+    return jsonify(errno=RET.OK,errmsg='OK',data=comment_dict)
 
 
 @news_blue.route('/comment_like',methods=['POST'])
@@ -379,65 +789,14 @@ def comments_news():
 def comment_like():
     """
     点赞或取消点赞
-    1、获取用户登录信息
-    2、获取参数，comment_id,action
-    3、检查参数的完整性
-    4、判断action是否为add，remove
-    5、把comment_id转成整型
-    6、根据comment_id查询数据库
-    7、判断查询结果
-    8、判断行为是点赞还是取消点赞
-    9、如果为点赞，查询改评论，点赞次数加1，否则减1
-    10、提交数据
-    11、返回结果
+    1、获取参数，comment_id,action['add','remove']
+    2、检查参数，提交后在redis中原子地点赞或取消点赞，见info.utils.actions.like_comment
+    3、推送最新的点赞数量，修改新闻的热度
+    4、返回最新的点赞数量
 
     :return:
     """
-    user = g.user
-    comment_id = request.json.get('comment_id')
-    action = request.json.get('action')
-    if not all([comment_id,action]):
-        return jsonify(errno=RET.PARAMERR,errmsg='参数不完整')
-    if action not in ['add','remove']:
-        return jsonify(errno=RET.PARAMERR,errmsg='参数错误')
-    try:
-        comment_id = int(comment_id)
-    except Exception as e:
-        current_app.logger.error(e)
-        return jsonify(errno=RET.DBERR,errmsg='参数错误')
-    try:
-        comments = Comment.query.get(comment_id)
-    except Exception as e:
-        current_app.logger.error(e)
-        return jsonify(errno=RET.DBERR,errmsg='保存数据失败')
-    if not comments:
-        return jsonify(errno=RET.NODATA,errmsg='评论不存在')
-    # 如果选择的是点赞
-    if action == 'add':
-        comment_like_model = CommentLike.query.filter(CommentLike.user_id==user.id,CommentLike.comment_id==comment_id).first()
-        # 判断查询结果，如果没有点赞过
-        if not comment_like_model:
-            comment_like_model = CommentLike()
-            comment_like_model.user_id = user.id
-            comment_like_model.comment_id = comment_id
-            # 把数据提交给数据库会话对象，点赞次数加1
-            db.session.add(comment_like_model)
-            comments.like_count += 1
-    # 如果取消点赞
-    else:
-        comment_like_model = CommentLike.query.filter(CommentLike.user_id==user.id,CommentLike.comment_id==comment_id).first()
-        if comment_like_model:
-            db.session.delete(comment_like_model)
-            comments.like_count -= 1
-
-    try:
-        db.session.commit()
-    except Exception as e:
-        current_app.logger.error(e)
-        db.session.rollback()
-        return jsonify(errno=RET.DBERR,errmsg='保存数据失败')
-
-    return jsonify(errno=RET.OK,errmsg='OK')
+    return run_action(like_comment, g.user, request.json)
 
 
 @news_blue.route('/followed_user',methods=['POST'])
@@ -445,69 +804,133 @@ def comment_like():
 def followed_user():
     """
     关注与取消关注
-    1、获取用户信息,如果未登录直接返回
-    2、获取参数，user_id和action
-    3、检查参数的完整性
-    4、校验参数，action是否为followed，unfollow
-    5、根据用户id获取被关注的用户
-    6、判断获取结果
-    7、根据对应的action执行操作，关注或取消关注
-    8、返回结果
+    1、获取参数，user_id和action['follow','unfollow']
+    2、检查参数、修改关注关系，见info.utils.actions.follow_user
+    3、提交数据，同步redis中缓存的关注集合
+    4、返回结果
+
+    :return:
+    """
+    return run_action(follow_user, g.user, request.json)
+
+
+@news_blue.route('/batch',methods=['POST'])
+@login_required
+def batch():
+    """
+    批量接口：一次请求执行多个操作，只加载一次session和用户、只校验一次csrf
+    1、获取参数，ops列表，每个操作为{"op": 操作名, "params": 参数}
+       写操作：collect(同/news_collect)、like(同/comment_like)、follow(同/followed_user)
+       读操作：news_list(同/news_list，params为查询参数)
+    2、检查参数，操作数量不超过BATCH_MAX_OPS；收藏、关注状态的判断读取redis中缓存的集合，
+       提交前集合不会变化，同一批次中不能重复操作同一对象
+    3、每个写操作在一个savepoint中执行，失败时只回滚该操作
+    4、所有写操作在同一个事务中提交，提交成功后再修改redis(包括点赞)，得到写操作的返回数据
+    5、按顺序返回每个操作的结果{"errno","errmsg","data"}
+
     :return:
     """
+    ops = (request.json or {}).get('ops')
+    if not isinstance(ops, list) or not ops:
+        return jsonify(errno=RET.PARAMERR,errmsg='参数缺失')
+    if len(ops) > constants.BATCH_MAX_OPS:
+        return jsonify(errno=RET.PARAMERR,errmsg='操作数量超出限制')
     user = g.user
-    if not user:
-        return jsonify(errno=RET.SESSIONERR,errmsg='用户未登录')
-    user_id = request.json.get('user_id')
-    action = request.json.get('action')
-    if not all([user_id,action]):
-        return jsonify(errno=RET.PARAMERR,errmsg='参数不完整')
-    if action not in ['follow','unfollow']:
-        return jsonify(errno=RET.PARAMERR,errmsg='参数错误')
+    results = []
+    # 写操作在results中的位置和提交后执行的函数
+    writes = []
+    # 已操作的对象 (操作名, 对象id)
+    targets = set()
+    for op in ops:
+        if not isinstance(op, dict) or not isinstance(op.get('params') or {}, dict):
+            results.append({'errno': RET.PARAMERR, 'errmsg': '参数格式错误'})
+            continue
+        name = op.get('op')
+        params = op.get('params') or {}
+        if name == 'news_list':
+            results.append(batch_news_list(params))
+            continue
+        action_func = BATCH_ACTIONS.get(name)
+        if not action_func:
+            results.append({'errno': RET.PARAMERR, 'errmsg': '操作不存在'})
+            continue
+        # 操作对象id转成int后判断是否重复，1、"1"、" 1"是同一对象
+        try:
+            target = (name, int(params.get(BATCH_TARGET_PARAMS[name])))
+        except Exception as e:
+            current_app.logger.error(e)
+            results.append({'errno': RET.PARAMERR, 'errmsg': '参数类型错误'})
+            continue
+        if target in targets:
+            results.append({'errno': RET.PARAMERR, 'errmsg': '不能重复操作同一对象'})
+            continue
+        targets.add(target)
+        savepoint = db.session.begin_nested()
+        try:
+            after_commit = action_func(user, params)
+            savepoint.commit()
+        except ActionError as e:
+            savepoint.rollback()
+            results.append({'errno': e.errno, 'errmsg': e.errmsg})
+            continue
+        except Exception as e:
+            current_app.logger.error(e)
+            savepoint.rollback()
+            results.append({'errno': RET.DBERR, 'errmsg': '保存数据失败'})
+            continue
+        writes.append((len(results), after_commit))
+        results.append(None)
+    # 提交所有写操作
     try:
-        other = User.query.get(user_id)
+        db.session.commit()
     except Exception as e:
         current_app.logger.error(e)
-        return jsonify(errno=RET.DBERR,errmsg='查询数据失败')
-    if not other:
-        return jsonify(errno=RET.NODATA,errmsg='无用户数据')
-    # 如果选择关注
-    if action == 'follow':
-        if other not in user.followed:
-            user.followed.append(other)
-        else:
-            return jsonify(errno=RET.DATAEXIST,errmsg='当前用户已被关注')
-    # 取消关注
-    else:
-        if other in user.followed:
-            user.followed.remove(other)
-
-    return jsonify(errno=RET.OK,errmsg='OK')
-
-        
-        
-        
-
-
-
-
-
-
-
-
-
-
+        db.session.rollback()
+        for index, _ in writes:
+            results[index] = {'errno': RET.DBERR, 'errmsg': '保存数据失败'}
+        writes = []
+    for index, after_commit in writes:
+        try:
+            results[index] = {'errno': RET.OK, 'errmsg': 'OK', 'data': after_commit()}
+        except ActionError as e:
+            results[index] = {'errno': e.errno, 'errmsg': e.errmsg}
 
+    return jsonify(errno=RET.OK,errmsg='OK',data=results)
 
 
+# 批量接口支持的写操作
+BATCH_ACTIONS = {
+    'collect': collect_news,
+    'like': like_comment,
+    'follow': follow_user,
+}
+# 写操作的操作对象参数
+BATCH_TARGET_PARAMS = {
+    'collect': 'news_id',
+    'like': 'comment_id',
+    'follow': 'user_id',
+}
 
 
+def batch_news_list(params):
+    """在批量接口中执行/news_list，使用params作为查询参数"""
+    try:
+        with current_app.test_request_context('/news_list', query_string=params):
+            response = make_response(get_news_list())
+        return json.loads(response.get_data(as_text=True))
+    except Exception as e:
+        current_app.logger.error(e)
+        return {'errno': RET.DBERR, 'errmsg': '查询数据失败'}
 
 
 # 加载项目logo图标，favicon.ico,浏览器会默认请求项目根路径下的favicon文件
 # http://127.0.0.1:5000/favicon.ico
 @news_blue.route('/favicon.ico')
 def favicon():
+    # 页面中通过asset_url引用带哈希的图标地址，这里只处理浏览器默认的请求
+    # 已发布静态文件时，返回预压缩的图标并允许缓存
+    if current_app.extensions.get('assets_manifest'):
+        return send_asset('news/favicon.ico')
     # 发送文件给浏览器,
     # send_static_file是Flask框架自带的函数，Flask框架静态路由的实现就是通过这个函数
     return current_app.send_static_file('news/favicon.ico')
@@ -11,7 +11,9 @@ from info import db,constants
 # 导入七牛云扩展
 from info.utils.image_storage import storage
 # 导入模型类
-from info.models import Category,News
+from info.models import Category,News,User
+# 导入新闻分类缓存
+from info.utils.category_cache import get_categories
 
 
 
@@ -164,19 +166,15 @@ def news_release():
     """
     user = g.user
     if request.method == 'GET':
-        # 查询新闻分类
+        # 查询新闻分类，读取进程内缓存的分类数据
         try:
-            categories = Category.query.all()
+            category_list = get_categories()
         except Exception as e:
             current_app.logger.error(e)
             return jsonify(errno=RET.DBERR,errmsg='查询新闻分类数据失败')
         # 判断查询结果
-        if not categories:
+        if not category_list:
             return jsonify(errno=RET.NODATA,errmsg='无新闻分类数据')
-        # 定义容器存储查询结果
-        category_list = []
-        for category in categories:
-            category_list.append(category.to_dict())
         # 移除最新分类
         category_list.pop(0)
         data = {
@@ -222,9 +220,10 @@ def news_release():
     news.index_image_url = constants.QINIU_DOMIN_PREFIX + image_name
     news.status = 1
     news.content = content
-    # 提交数据到mysql中
+    # 提交数据到mysql中，用户发布的新闻数量在同一个事务中加1
     try:
         db.session.add(news)
+        User.incr_counter(user.id, 'news_count')
         db.session.commit()
     except Exception as e:
         current_app.logger.error(e)
@@ -11,6 +11,31 @@ $(function(){
         $('.login_form_con').show();
     })
 
+    // 外壳模式：页面所有用户共用，加载后获取当前用户的个性化数据
+    if ($(".detail_con").attr("data-shell")) {
+        loadViewerState($(".detail_con").attr("data-newsid"))
+    }
+
+    // 实时接收新评论和点赞数量，服务器开启实时推送(NEWS_LIVE_STREAM)时才连接
+    if (window.EventSource && $(".detail_con").attr("data-live")) {
+        var live_news_id = $(".detail_con").attr("data-newsid")
+        var source = new EventSource("/news/" + live_news_id + "/stream")
+        source.addEventListener("comment", function (e) {
+            var comment = JSON.parse(e.data)
+            // 自己发表的评论已经显示
+            if (!hasComment(comment.id)) {
+                $(".comment_list_con").prepend(commentHtml(comment, live_news_id))
+                updateCommentCount()
+            }
+        })
+        source.addEventListener("like", function (e) {
+            var like = JSON.parse(e.data)
+            var $like = $('.comment_up[data-commentid="' + like.comment_id + '"]')
+            $like.attr("data-likecount", like.like_count)
+            $like.html(like.like_count > 0 ? like.like_count : "赞")
+        })
+    }
+
     // 收藏
     $(".collection").click(function () {
         var params = {
@@ -104,16 +129,16 @@ $(function(){
                     comment_html += '<div class="comment_list">'
                     comment_html += '<div class="person_pic fl">'
                     if (comment.user.avatar_url) {
-                        comment_html += '<img src="' + comment.user.avatar_url + '" alt="用户图标">'
+                        comment_html += '<img src="' + escapeHtml(comment.user.avatar_url) + '" alt="用户图标">'
                     }else {
                         comment_html += '<img src="../../static/news/images/person01.png" alt="用户图标">'
                     }
                     comment_html += '</div>'
-                    comment_html += '<div class="user_name fl">' + comment.user.nick_name + '</div>'
+                    comment_html += '<div class="user_name fl">' + escapeHtml(comment.user.nick_name) + '</div>'
                     comment_html += '<div class="comment_text fl">'
-                    comment_html += comment.content
+                    comment_html += escapeHtml(comment.content)
                     comment_html += '</div>'
-                    comment_html += '<div class="comment_time fl">' + comment.create_time + '</div>'
+                    comment_html += '<div class="comment_time fl">' + escapeHtml(comment.create_time) + '</div>'
 
                     comment_html += '<a href="javascript:;" class="comment_up fr" data-commentid="' + comment.id + '" data-newsid="' + comment.news_id + '">赞</a>'
                     comment_html += '<a href="javascript:;" class="comment_reply fr">回复</a>'
@@ -124,8 +149,10 @@ $(function(){
                     comment_html += '</form>'
 
                     comment_html += '</div>'
-                    // 拼接到内容的前面
-                    $(".comment_list_con").prepend(comment_html)
+                    // 拼接到内容的前面，实时推送可能已经先显示了这条评论
+                    if (!hasComment(comment.id)) {
+                        $(".comment_list_con").prepend(comment_html)
+                    }
                     // 让comment_sub 失去焦点
                     $('.comment_sub').blur();
                     // 清空输入框内容
@@ -183,19 +210,14 @@ $(function(){
                 success: function (resp) {
                     if (resp.errno == "0") {
 
-                        var like_count = $this.attr('data-likecount')
-
-                        if(like_count == undefined){
-                            like_count = 0;
-                        }
+                        // 使用后端返回的最新点赞数量
+                        var like_count = resp.data.like_count
 
                         // 更新点赞按钮图标
                         if (action == "add") {
-                            like_count = parseInt(like_count) + 1
                             // 代表是点赞
                             $this.addClass('has_comment_up')
                         }else {
-                            like_count = parseInt(like_count) - 1
                             $this.removeClass('has_comment_up')
                         }
                         // 更新点赞数据
@@ -250,22 +272,22 @@ $(function(){
                         comment_html += '<div class="comment_list">'
                         comment_html += '<div class="person_pic fl">'
                         if (comment.user.avatar_url) {
-                            comment_html += '<img src="' + comment.user.avatar_url + '" alt="用户图标">'
+                            comment_html += '<img src="' + escapeHtml(comment.user.avatar_url) + '" alt="用户图标">'
                         }else {
                             comment_html += '<img src="../../static/news/images/person01.png" alt="用户图标">'
                         }
                         comment_html += '</div>'
-                        comment_html += '<div class="user_name fl">' + comment.user.nick_name + '</div>'
+                        comment_html += '<div class="user_name fl">' + escapeHtml(comment.user.nick_name) + '</div>'
                         comment_html += '<div class="comment_text fl">'
-                        comment_html += comment.content
+                        comment_html += escapeHtml(comment.content)
                         comment_html += '</div>'
                         comment_html += '<div class="reply_text_con fl">'
-                        comment_html += '<div class="user_name2">' + comment.parent.user.nick_name + '</div>'
+                        comment_html += '<div class="user_name2">' + escapeHtml(comment.parent.user.nick_name) + '</div>'
                         comment_html += '<div class="reply_text">'
-                        comment_html += comment.parent.content
+                        comment_html += escapeHtml(comment.parent.content)
                         comment_html += '</div>'
                         comment_html += '</div>'
-                        comment_html += '<div class="comment_time fl">' + comment.create_time + '</div>'
+                        comment_html += '<div class="comment_time fl">' + escapeHtml(comment.create_time) + '</div>'
 
                         comment_html += '<a href="javascript:;" class="comment_up fr" data-commentid="' + comment.id + '" data-newsid="' + comment.news_id + '">赞</a>'
                         comment_html += '<a href="javascript:;" class="comment_reply fr">回复</a>'
@@ -276,7 +298,9 @@ $(function(){
                         comment_html += '</form>'
 
                         comment_html += '</div>'
-                        $(".comment_list_con").prepend(comment_html)
+                        if (!hasComment(comment.id)) {
+                            $(".comment_list_con").prepend(comment_html)
+                        }
                         // 请空输入框
                         $this.prev().val('')
                         // 关闭
@@ -291,6 +315,30 @@ $(function(){
 
         }
     })
+    // 加载更多评论
+    $(".comment_more").click(function () {
+        var $this = $(this)
+        var news_id = $this.attr('data-newsid')
+        var params = {
+            "cursor": $this.attr('data-cursor')
+        }
+        $.get("/news/" + news_id + "/comments", params, function (resp) {
+            if (resp.errno == "0") {
+                for (var i=0;i<resp.data.comments.length;i++) {
+                    $(".comment_list_con").append(commentHtml(resp.data.comments[i], news_id))
+                }
+                // 没有下一页时隐藏加载按钮
+                if (resp.data.next_cursor) {
+                    $this.attr('data-cursor', resp.data.next_cursor)
+                }else {
+                    $this.hide()
+                }
+            }else {
+                alert(resp.errmsg)
+            }
+        })
+    })
+
     // 关注当前新闻作者
     $(".focus").click(function () {
         var user_id = $(this).attr('data-userid')
@@ -366,4 +414,106 @@ $(function(){
 function updateCommentCount(){
     var count = $('.comment_list').length
     $('.comment_count').html(count+"条评论")
-}
\ No newline at end of file
+}
+
+
+// 转义html特殊字符，评论内容、昵称等用户输入拼接到html前必须转义
+function escapeHtml(value) {
+    return String(value === undefined || value === null ? '' : value)
+        .replace(/&/g, '&amp;')
+        .replace(/</g, '&lt;')
+        .replace(/>/g, '&gt;')
+        .replace(/"/g, '&quot;')
+        .replace(/'/g, '&#39;')
+}
+
+
+// 拼接一条评论的html，所有来自服务器的数据都经过转义
+function commentHtml(comment, news_id) {
+    var comment_html = ''
+    comment_html += '<div class="comment_list">'
+    comment_html += '<div class="person_pic fl">'
+    if (comment.user.avatar_url) {
+        comment_html += '<img src="' + escapeHtml(comment.user.avatar_url) + '" alt="用户图标">'
+    }else {
+        comment_html += '<img src="../../static/news/images/person01.png" alt="用户图标">'
+    }
+    comment_html += '</div>'
+    comment_html += '<div class="user_name fl">' + escapeHtml(comment.user.nick_name) + '</div>'
+    comment_html += '<div class="comment_text fl">'
+    comment_html += escapeHtml(comment.content)
+    comment_html += '</div>'
+    if (comment.parent) {
+        comment_html += '<div class="reply_text_con fl">'
+        comment_html += '<div class="user_name2">' + escapeHtml(comment.parent.user.nick_name) + '</div>'
+        comment_html += '<div class="reply_text">'
+        comment_html += escapeHtml(comment.parent.content)
+        comment_html += '</div>'
+        comment_html += '</div>'
+    }
+    comment_html += '<div class="comment_time fl">' + escapeHtml(comment.create_time) + '</div>'
+
+    comment_html += '<a href="javascript:;" class="comment_up' + (comment.is_like ? ' has_comment_up' : '') + ' fr" data-commentid="' + escapeHtml(comment.id) + '" data-likecount="' + escapeHtml(comment.like_count) + '" data-newsid="' + escapeHtml(news_id) + '">'
+    comment_html += comment.like_count > 0 ? escapeHtml(comment.like_count) : '赞'
+    comment_html += '</a>'
+    comment_html += '<a href="javascript:;" class="comment_reply fr">回复</a>'
+    comment_html += '<form class="reply_form fl" data-commentid="' + escapeHtml(comment.id) + '" data-newsid="' + escapeHtml(news_id) + '">'
+    comment_html += '<textarea class="reply_input"></textarea>'
+    comment_html += '<input type="button" value="回复" class="reply_sub fr">'
+    comment_html += '<input type="reset" name="" value="取消" class="reply_cancel fr">'
+    comment_html += '</form>'
+    comment_html += '</div>'
+    return comment_html
+}
+
+
+// 评论是否已经显示
+function hasComment(comment_id) {
+    return $('.comment_up[data-commentid="' + comment_id + '"]').length > 0
+}
+
+
+// 获取当前用户的登录信息、收藏、关注、点赞状态，更新外壳页面
+function loadViewerState(news_id) {
+    var comment_ids = []
+    $(".comment_up").each(function () {
+        comment_ids.push($(this).attr("data-commentid"))
+    })
+    $.get("/news/" + news_id + "/viewer_state", {"comment_ids": comment_ids.join(",")}, function (resp) {
+        if (resp.errno != "0") {
+            return
+        }
+        var state = resp.data
+        // 登录用户显示用户信息和评论框
+        if (state.user_info) {
+            var avatar_url = state.user_info.avatar_url || "../../static/news/images/person01.png"
+            $(".user_btns").hide()
+            $(".user_login .lgin_pic").attr("src", avatar_url)
+            $(".user_login a").first().text(state.user_info.nick_name)
+            $(".user_login").show()
+            $(".comment_form .person_pic img").attr("src", avatar_url)
+            $(".comment_form").show()
+            $(".comment_form_logout").hide()
+        }
+        if (state.is_collected) {
+            $(".collection").hide()
+            $(".collected").show()
+        }
+        if (state.is_followed) {
+            $(".focus").hide()
+            $(".focused").show()
+        }
+        // 更新点赞数量和点赞状态
+        $(".comment_up").each(function () {
+            var comment_id = parseInt($(this).attr("data-commentid"))
+            var like_count = state.like_counts[comment_id]
+            if (like_count !== undefined) {
+                $(this).attr("data-likecount", like_count)
+                $(this).html(like_count > 0 ? like_count : "赞")
+            }
+            if (state.like_ids.indexOf(comment_id) >= 0) {
+                $(this).addClass("has_comment_up")
+            }
+        })
+    })
+}
@@ -1,6 +1,6 @@
 var currentCid = 1; // 当前分类 id
 var cur_page = 1; // 当前页
-var total_page = 1;  // 总页数
+var next_cursor = "";  // 下一页的游标，为null时没有下一页
 var data_querying = true;   // 是否正在向后台获取数据
 
 
@@ -21,7 +21,7 @@ $(function () {
 
             // 重置分页参数
             cur_page = 1
-            total_page = 1
+            next_cursor = ""
             updateNewsData()
         }
     })
@@ -46,7 +46,7 @@ $(function () {
             // 判断页数，去更新新闻数据
             if (!data_querying){
                 data_querying = true
-                if (cur_page < total_page){
+                if (next_cursor){
                     cur_page += 1
                     updateNewsData()
                 }
@@ -61,13 +61,13 @@ function updateNewsData() {
     // 更新新闻数据
     var params = {
         "cid":currentCid,
-        "page":cur_page
+        "cursor":next_cursor
     }
-    // http://127.0.0.1:5000/news_list?cid=1&page=1
+    // http://127.0.0.1:5000/news_list?cid=1&cursor=
     $.get("/news_list",params,function(resp){
         data_querying = false
         if (resp.errno == "0"){
-            total_page = resp.data.total_page
+            next_cursor = resp.data.next_cursor
             if (cur_page == 1){
                 // 清除ul列表的所有内容
                 $(".list_con").html("")
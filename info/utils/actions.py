@@ -0,0 +1,211 @@
+# 用户操作：收藏、点赞、关注
+# 操作只检查参数、修改数据库会话，不提交事务，由调用方统一提交；
+# 提交成功后再执行返回的函数，修改redis并返回给前端的数据，提交失败时redis不会被修改
+# 单个操作的视图和批量接口(/batch)共用这些函数
+import time
+
+from flask import current_app, jsonify
+
+from info import db
+from info.models import User, News, Comment
+from info.utils.response_code import RET
+from info.utils.news_cache import get_news_many, delete_news_cache, bump_news_version
+from info.utils.membership import is_collected, is_following, sync_collection, sync_following, get_collect_time
+from info.utils.comment_like import toggle_comment_like
+from info.utils.trending import record_trending, record_like_trending
+from info.utils.timeline import invalidate_timeline
+from info.utils.live import publish_like
+from info.utils.conditional import bump_user_version
+
+
+class ActionError(Exception):
+    """操作失败，errno和errmsg直接返回给前端"""
+    def __init__(self, errno, errmsg):
+        super(ActionError, self).__init__(errmsg)
+        self.errno = errno
+        self.errmsg = errmsg
+
+
+def _check_user(user):
+    if not user:
+        raise ActionError(RET.SESSIONERR, '用户未登录')
+
+
+def _query(func, *args):
+    """查询数据库，失败时转换为ActionError"""
+    try:
+        return func(*args)
+    except Exception as e:
+        current_app.logger.error(e)
+        raise ActionError(RET.DBERR, '查询数据失败')
+
+
+def collect_news(user, params):
+    """
+    收藏或取消收藏
+    1、判断用户是否登录
+    2、获取参数，news_id，action['cancel_collect','collect']
+    3、检查参数，news_id转成int类型，action在参数范围内
+    4、查询数据库，确认新闻存在
+    5、判断用户是否收藏过，修改收藏关系
+
+    :return: 提交后执行的函数
+    """
+    _check_user(user)
+    news_id = params.get('news_id')
+    action = params.get('action')
+    if not all([news_id, action]):
+        raise ActionError(RET.PARAMERR, '参数缺失')
+    try:
+        news_id = int(news_id)
+    except Exception as e:
+        current_app.logger.error(e)
+        raise ActionError(RET.PARAMERR, '参数类型错误')
+    if action not in ['collect', 'cancel_collect']:
+        raise ActionError(RET.PARAMERR, '参数范围错误')
+    news = _query(News.query.get, news_id)
+    if not news:
+        raise ActionError(RET.NODATA, '无新闻数据')
+    # 修改前使用mysql判断，redis中缓存的集合可能已过期
+    collected = _query(is_collected, user.id, news_id, True)
+    collect_time = None
+    if action == 'collect':
+        if not collected:
+            user.collection_news.append(news)
+    else:
+        if collected:
+            # 取消收藏时按收藏时间扣除热度
+            collect_time = _query(get_collect_time, user.id, news_id)
+            user.collection_news.remove(news)
+    db.session.add(user)
+
+    def after_commit():
+        # 同步redis中缓存的收藏集合，删除缓存的新闻数据
+        sync_collection(user.id, news_id, action == 'collect')
+        delete_news_cache(news_id)
+        # 收藏状态被修改时，增加或撤销新闻的热度
+        if news.status == 0 and collected != (action == 'collect'):
+            if action == 'collect':
+                record_trending(news_id, news.category_id, 'collect')
+            elif collect_time:
+                record_trending(news_id, news.category_id, 'collect', -1, time.mktime(collect_time.timetuple()))
+    return after_commit
+
+
+def like_comment(user, params):
+    """
+    点赞或取消点赞
+    1、判断用户是否登录
+    2、获取参数，comment_id,action['add','remove']
+    3、检查参数，comment_id转成int类型
+    4、查询数据库，确认评论存在
+    5、提交后在redis中原子地点赞或取消点赞，由写回任务批量保存到mysql
+
+    :return: 提交后执行的函数，返回{'like_count': 最新的点赞数量}
+    """
+    _check_user(user)
+    comment_id = params.get('comment_id')
+    action = params.get('action')
+    if not all([comment_id, action]):
+        raise ActionError(RET.PARAMERR, '参数不完整')
+    if action not in ['add', 'remove']:
+        raise ActionError(RET.PARAMERR, '参数错误')
+    try:
+        comment_id = int(comment_id)
+    except Exception as e:
+        current_app.logger.error(e)
+        raise ActionError(RET.PARAMERR, '参数错误')
+    comment = _query(Comment.query.get, comment_id)
+    if not comment:
+        raise ActionError(RET.NODATA, '评论不存在')
+    news_id = comment.news_id
+    user_id = user.id
+
+    def after_commit():
+        try:
+            like_count, changed = toggle_comment_like(comment_id, user_id, action == 'add')
+        except Exception as e:
+            current_app.logger.error(e)
+            raise ActionError(RET.DBERR, '保存数据失败')
+        # 点赞状态被修改时，推送最新的点赞数量，点赞时增加评论所在新闻的热度
+        if changed:
+            # 详情页展示点赞数和点赞状态，页面版本号加1
+            bump_news_version(news_id)
+            publish_like(news_id, comment_id, like_count)
+            try:
+                news_dict_list = get_news_many([news_id], 'detail')
+            except Exception as e:
+                current_app.logger.error(e)
+                news_dict_list = []
+            # 取消点赞不扣除热度，每个用户对每条评论只计入一次
+            if action == 'add' and news_dict_list and news_dict_list[0]['status'] == 0:
+                record_like_trending(news_id, (news_dict_list[0]['category'] or {}).get('id'), comment_id, user_id)
+        return {'like_count': like_count}
+    return after_commit
+
+
+def follow_user(user, params):
+    """
+    关注与取消关注
+    1、判断用户是否登录
+    2、获取参数，user_id和action['follow','unfollow']
+    3、根据用户id获取被关注的用户
+    4、判断是否已关注，修改关注关系，粉丝数量和关注数量在同一个事务中修改
+
+    :return: 提交后执行的函数
+    """
+    _check_user(user)
+    user_id = params.get('user_id')
+    action = params.get('action')
+    if not all([user_id, action]):
+        raise ActionError(RET.PARAMERR, '参数不完整')
+    if action not in ['follow', 'unfollow']:
+        raise ActionError(RET.PARAMERR, '参数错误')
+    other = _query(User.query.get, user_id)
+    if not other:
+        raise ActionError(RET.NODATA, '无用户数据')
+    # 修改前使用mysql判断，redis中缓存的集合可能已过期
+    following = _query(is_following, user.id, other.id, True)
+    if action == 'follow':
+        if following:
+            raise ActionError(RET.DATAEXIST, '当前用户已被关注')
+        user.followed.append(other)
+        User.incr_counter(other.id, 'followers_count')
+        User.incr_counter(user.id, 'following_count')
+    else:
+        if following:
+            user.followed.remove(other)
+            User.incr_counter(other.id, 'followers_count', -1)
+            User.incr_counter(user.id, 'following_count', -1)
+
+    def after_commit():
+        # 同步redis中缓存的关注集合，关注的作者变化后重新加载时间线
+        sync_following(user.id, other.id, action == 'follow')
+        invalidate_timeline(user.id)
+        # 详情页展示是否关注了作者，当前用户的页面版本号加1
+        bump_user_version(user.id)
+    return after_commit
+
+
+def run_action(action_func, user, params):
+    """
+    执行单个操作并提交事务，返回json响应
+    操作失败或提交失败时回滚，提交成功后执行操作返回的函数
+    """
+    try:
+        after_commit = action_func(user, params or {})
+        db.session.commit()
+    except ActionError as e:
+        db.session.rollback()
+        return jsonify(errno=e.errno, errmsg=e.errmsg)
+    except Exception as e:
+        current_app.logger.error(e)
+        db.session.rollback()
+        return jsonify(errno=RET.DBERR, errmsg='保存数据失败')
+    try:
+        data = after_commit()
+    except ActionError as e:
+        return jsonify(errno=e.errno, errmsg=e.errmsg)
+    if data is None:
+        return jsonify(errno=RET.OK, errmsg='OK')
+    return jsonify(errno=RET.OK, errmsg='OK', data=data)
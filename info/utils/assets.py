@@ -0,0 +1,150 @@
+# 静态文件发布：python manage.py assets 把static目录下的文件复制到static_build目录
+# 每个文件生成带内容哈希的文件名，文本类文件预先压缩为.gz，安装了brotli模块时再生成.br
+# 模板中使用asset_url生成带哈希的地址，/assets/路由按浏览器支持的编码返回预压缩的文件
+# 带哈希的文件内容不会变化，可以被浏览器和CDN永久缓存
+import gzip
+import hashlib
+import io
+import json
+import mimetypes
+import os
+
+from flask import current_app, request, send_from_directory, url_for
+
+# 发布目录，位于info目录下
+BUILD_FOLDER = 'static_build'
+# 文件名 -> 带哈希的文件名
+MANIFEST_NAME = 'manifest.json'
+# 需要预压缩的文件类型，图片等已压缩的文件不再压缩
+COMPRESS_EXTENSIONS = {'.js', '.css', '.html', '.htm', '.svg', '.json', '.txt', '.xml', '.ico', '.ttf', '.eot'}
+# 文件名中哈希的长度
+HASH_LENGTH = 10
+# 带哈希的文件的缓存时间，单位：秒
+IMMUTABLE_MAX_AGE = 365 * 24 * 3600
+# 不带哈希的文件的缓存时间，tinymce插件、css中引用的图片等通过相对路径按原文件名加载
+PLAIN_MAX_AGE = 3600
+
+
+def _hashed_name(path, digest):
+    root, ext = os.path.splitext(path)
+    return '%s.%s%s' % (root, digest[:HASH_LENGTH], ext)
+
+
+def _gzip(data):
+    """gzip压缩，文件头中的时间固定为0，内容不变时压缩结果不变"""
+    buf = io.BytesIO()
+    with gzip.GzipFile(fileobj=buf, mode='wb', compresslevel=9, mtime=0) as f:
+        f.write(data)
+    return buf.getvalue()
+
+
+def _write(path, data):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'wb') as f:
+        f.write(data)
+
+
+def _write_variants(path, data, compress):
+    """写入文件和预压缩的文件，压缩后没有变小的不保存"""
+    _write(path, data)
+    for suffix, compressed in compress(data):
+        if len(compressed) < len(data):
+            _write(path + suffix, compressed)
+        elif os.path.exists(path + suffix):
+            os.remove(path + suffix)
+
+
+def build_assets(static_folder, build_folder):
+    """
+    发布静态文件
+    1、遍历static目录，计算每个文件内容的md5
+    2、按原文件名和带哈希的文件名各写入一份，文本类文件同时写入.gz和.br
+    3、最后写入manifest，已发布的旧版本文件保留，已打开的页面仍然可以加载
+
+    :return: 发布的文件数量
+    """
+    try:
+        import brotli
+    except ImportError:
+        brotli = None
+
+    def compress(data):
+        yield '.gz', _gzip(data)
+        if brotli is not None:
+            yield '.br', brotli.compress(data)
+
+    def no_compress(data):
+        return []
+
+    manifest = {}
+    for root, dirs, files in os.walk(static_folder):
+        dirs.sort()
+        for name in sorted(files):
+            source = os.path.join(root, name)
+            path = os.path.relpath(source, static_folder).replace(os.sep, '/')
+            with open(source, 'rb') as f:
+                data = f.read()
+            hashed = _hashed_name(path, hashlib.md5(data).hexdigest())
+            handler = compress if os.path.splitext(name)[1].lower() in COMPRESS_EXTENSIONS else no_compress
+            _write_variants(os.path.join(build_folder, path), data, handler)
+            _write_variants(os.path.join(build_folder, hashed), data, handler)
+            manifest[path] = hashed
+    manifest_path = os.path.join(build_folder, MANIFEST_NAME)
+    with open(manifest_path + '.tmp', 'w') as f:
+        json.dump(manifest, f, indent=1, sort_keys=True)
+    os.replace(manifest_path + '.tmp', manifest_path)
+    return len(manifest)
+
+
+def asset_url(filename):
+    """
+    模板中使用的静态文件地址
+    已发布时返回带哈希的/assets/地址，否则返回flask默认的/static/地址
+    """
+    manifest = current_app.extensions.get('assets_manifest')
+    if manifest and filename in manifest:
+        return url_for('assets', filename=manifest[filename])
+    return url_for('static', filename=filename)
+
+
+def send_asset(filename):
+    """
+    返回已发布的静态文件
+    1、浏览器支持br或gzip，且存在预压缩的文件时，返回预压缩的文件
+    2、带哈希的文件永久缓存，原文件名的文件缓存PLAIN_MAX_AGE
+    """
+    build_folder = os.path.join(current_app.root_path, BUILD_FOLDER)
+    mimetype = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+    encoding, suffix = None, ''
+    for name, ext in (('br', '.br'), ('gzip', '.gz')):
+        if request.accept_encodings[name] and os.path.isfile(os.path.join(build_folder, filename + ext)):
+            encoding, suffix = name, ext
+            break
+    response = send_from_directory(build_folder, filename + suffix, mimetype=mimetype)
+    if encoding:
+        response.headers['Content-Encoding'] = encoding
+    response.vary.add('Accept-Encoding')
+    if filename in current_app.extensions.get('assets_hashed', ()):
+        response.headers['Cache-Control'] = 'public, max-age=%d, immutable' % IMMUTABLE_MAX_AGE
+    else:
+        response.headers['Cache-Control'] = 'public, max-age=%d' % PLAIN_MAX_AGE
+    return response
+
+
+def init_assets(app):
+    """
+    注册asset_url模板函数和/assets/路由
+    配置USE_ASSET_MANIFEST为True且已发布时，加载manifest，发布后需要重启进程
+    """
+    manifest = {}
+    manifest_path = os.path.join(app.root_path, BUILD_FOLDER, MANIFEST_NAME)
+    if app.config.get('USE_ASSET_MANIFEST') and os.path.isfile(manifest_path):
+        try:
+            with open(manifest_path) as f:
+                manifest = json.load(f)
+        except Exception as e:
+            app.logger.error(e)
+    app.extensions['assets_manifest'] = manifest
+    app.extensions['assets_hashed'] = set(manifest.values())
+    app.add_template_global(asset_url, 'asset_url')
+    app.add_url_rule('/assets/<path:filename>', 'assets', send_asset)
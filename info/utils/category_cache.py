@@ -0,0 +1,52 @@
+# 新闻分类缓存：每个进程只加载一次分类数据
+# 分类的版本号保存在redis中，分类被修改时版本号加1，各进程发现版本变化后重新加载
+import threading
+
+from flask import current_app
+
+from info import redis_store
+from info.models import Category
+
+# 分类版本号的键名
+CATEGORY_VERSION_KEY = 'category_version'
+
+_registry = {'version': None, 'loaded': False, 'categories': []}
+_lock = threading.Lock()
+
+
+def get_category_version():
+    """获取redis中的分类版本号，redis不可用时返回None"""
+    try:
+        return redis_store.get(CATEGORY_VERSION_KEY) or '0'
+    except Exception as e:
+        current_app.logger.error(e)
+        return None
+
+
+def get_categories():
+    """
+    获取全部新闻分类
+    1、读取redis中的分类版本号
+    2、版本号与进程内缓存的版本号一致，直接返回缓存的分类
+    3、否则查询mysql重新加载
+    redis不可用时，继续使用已加载的分类
+
+    :return: 分类字典列表
+    """
+    version = get_category_version()
+    with _lock:
+        if not _registry['loaded'] or (version is not None and version != _registry['version']):
+            categories = Category.query.order_by(Category.id).all()
+            _registry['categories'] = [category.to_dict() for category in categories]
+            _registry['version'] = version
+            _registry['loaded'] = True
+        # 返回副本，调用方可以修改分类字典
+        return [dict(category) for category in _registry['categories']]
+
+
+def bump_category_version():
+    """分类被修改后，增加版本号，通知所有进程重新加载"""
+    try:
+        redis_store.incr(CATEGORY_VERSION_KEY)
+    except Exception as e:
+        current_app.logger.error(e)
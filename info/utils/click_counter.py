@@ -0,0 +1,151 @@
+# 新闻点击量延迟写回：浏览新闻时只在redis中累加点击量，
+# 由写回任务(manage.py flush_clicks或后台线程)定期批量更新到mysql
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta
+
+from flask import current_app
+from sqlalchemy import case
+
+from info import redis_store, db, constants
+from info.models import News, ClickFlush
+from info.utils.redis_lock import acquire_lock, release_lock
+from info.utils.news_cache import delete_news_cache_many
+
+# 等待写回的点击增量，hash结构 新闻id -> 增量
+CLICK_PENDING_KEY = 'news_click_pending'
+# 正在写回的点击增量，写回前由pending重命名得到
+CLICK_FLUSHING_KEY = 'news_click_flushing'
+# 写回任务的锁，保证多个进程不会同时写回
+CLICK_FLUSH_LOCK_KEY = 'news_click_flush_lock'
+# 正在写回的flushing对应的写回编号，用来生成批次编号
+CLICK_FLUSH_ID_KEY = 'news_click_flush_id'
+
+# 开始写回，返回写回编号，没有需要写回的数据时返回nil
+# flushing不存在时，把pending重命名为flushing并生成新的写回编号；存在时继续上次的写回
+# KEYS[1] pending KEYS[2] flushing KEYS[3] 写回编号 ARGV[1] 新的写回编号
+START_SCRIPT = redis_store.register_script("""
+if redis.call('EXISTS', KEYS[2]) == 0 then
+    if redis.call('EXISTS', KEYS[1]) == 0 then
+        return false
+    end
+    redis.call('RENAME', KEYS[1], KEYS[2])
+    redis.call('SET', KEYS[3], ARGV[1])
+end
+if redis.call('SETNX', KEYS[3], ARGV[1]) == 1 then
+    return ARGV[1]
+end
+return redis.call('GET', KEYS[3])
+""")
+
+
+def incr_news_clicks(news_id):
+    """记录一次新闻浏览"""
+    try:
+        redis_store.hincrby(CLICK_PENDING_KEY, news_id, 1)
+    except Exception as e:
+        current_app.logger.error(e)
+
+
+def get_pending_clicks(news_ids):
+    """
+    获取新闻尚未写回mysql的点击增量
+    正在写回中的增量也需要计算在内
+
+    :param news_ids: 新闻id列表
+    :return: 字典，新闻id -> 增量
+    """
+    pending = dict.fromkeys(news_ids, 0)
+    if not news_ids:
+        return pending
+    try:
+        pipeline = redis_store.pipeline()
+        pipeline.hmget(CLICK_PENDING_KEY, news_ids)
+        pipeline.hmget(CLICK_FLUSHING_KEY, news_ids)
+        results = pipeline.execute()
+    except Exception as e:
+        current_app.logger.error(e)
+        return pending
+    for values in results:
+        for news_id, value in zip(news_ids, values):
+            if value:
+                pending[news_id] += int(value)
+    return pending
+
+
+def flush_clicks(batch_size=constants.CLICK_FLUSH_BATCH_SIZE):
+    """
+    把redis中的点击增量写回mysql
+    1、获取写回锁，获取失败说明其他进程正在写回；锁的值为随机令牌，只释放自己持有的锁
+    2、把pending重命名为flushing，之后的浏览计入新的pending
+       如果上次写回失败，flushing仍然存在，直接继续写回
+    3、按新闻id排序后分批，生成 update info_news set clicks = clicks + case id when ... end 语句
+    4、批次编号和点击量在同一个事务中写入ClickFlush，批次已写回时跳过，
+       提交成功但redis清理失败时，下次写回不会重复累加
+    5、每批提交成功后，从flushing中删除对应的新闻并删除新闻缓存，全部完成后删除flushing和写回编号
+    6、释放写回锁
+
+    :return: 写回的新闻数量
+    """
+    token = acquire_lock(CLICK_FLUSH_LOCK_KEY, constants.CLICK_FLUSH_LOCK_EXPIRES)
+    if not token:
+        return 0
+    try:
+        flush_id = START_SCRIPT(keys=[CLICK_PENDING_KEY, CLICK_FLUSHING_KEY, CLICK_FLUSH_ID_KEY],
+                                args=[uuid.uuid4().hex])
+        if not flush_id:
+            return 0
+        pending = redis_store.hgetall(CLICK_FLUSHING_KEY)
+        items = sorted((int(news_id), int(delta)) for news_id, delta in pending.items() if int(delta))
+        for i in range(0, len(items), batch_size):
+            batch = dict(items[i:i + batch_size])
+            # 已写回的新闻会从flushing中删除，剩余新闻重新分批时，未完成的批次组成不变
+            batch_id = '%s:%d:%d' % (flush_id, items[i][0], items[i:i + batch_size][-1][0])
+            if not ClickFlush.query.get(batch_id):
+                # update_time保持不变，点击量变化不算新闻内容修改
+                News.query.filter(News.id.in_(list(batch.keys()))).update({
+                    News.clicks: News.clicks + case(batch, value=News.id, else_=0),
+                    News.update_time: News.update_time
+                }, synchronize_session=False)
+                db.session.add(ClickFlush(id=batch_id))
+                try:
+                    db.session.commit()
+                except Exception:
+                    db.session.rollback()
+                    raise
+            redis_store.hdel(CLICK_FLUSHING_KEY, *batch.keys())
+            # 缓存的新闻数据中的点击量已过期，增量从flushing删除后不再计入，需要重新加载
+            delete_news_cache_many(list(batch.keys()))
+        redis_store.delete(CLICK_FLUSHING_KEY, CLICK_FLUSH_ID_KEY)
+        # 删除过期的批次记录
+        try:
+            ClickFlush.query.filter(ClickFlush.create_time <
+                                    datetime.now() - timedelta(seconds=constants.CLICK_FLUSH_RECORD_EXPIRES)) \
+                .delete(synchronize_session=False)
+            db.session.commit()
+        except Exception as e:
+            current_app.logger.error(e)
+            db.session.rollback()
+        return len(items)
+    finally:
+        release_lock(CLICK_FLUSH_LOCK_KEY, token)
+
+
+def start_click_flusher(app, interval):
+    """在当前进程中启动后台线程，每隔interval秒写回一次点击量"""
+    def run():
+        while True:
+            time.sleep(interval)
+            with app.app_context():
+                try:
+                    flush_clicks()
+                except Exception as e:
+                    app.logger.error(e)
+                finally:
+                    db.session.remove()
+
+    thread = threading.Thread(target=run, name='click-flusher')
+    thread.daemon = True
+    thread.start()
+    return thread
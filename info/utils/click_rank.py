@@ -0,0 +1,75 @@
+# 新闻点击排行：使用redis的有序集合存储 新闻id -> 点击量
+# 首页和详情页的点击排行只需要一次zrevrange，不再对info_news表排序
+from flask import current_app
+
+from info import redis_store, constants
+from info.models import News
+from info.utils.news_cache import get_news_many
+
+# 点击排行有序集合的键名
+CLICK_RANK_KEY = 'news_click_rank'
+
+
+def seed_click_rank():
+    """
+    从mysql加载已审核通过新闻的点击量，重建点击排行
+    1、只查询新闻id和点击量两列
+    2、先写入临时键，写完后rename，避免重建过程中排行为空
+
+    :return: 写入排行的新闻数量
+    """
+    rows = News.query.with_entities(News.id, News.clicks).filter(News.status == 0).all()
+    tmp_key = CLICK_RANK_KEY + '_tmp'
+    pipeline = redis_store.pipeline()
+    pipeline.delete(tmp_key)
+    for news_id, clicks in rows:
+        pipeline.zadd(tmp_key, clicks or 0, news_id)
+    if rows:
+        pipeline.rename(tmp_key, CLICK_RANK_KEY)
+    else:
+        pipeline.delete(CLICK_RANK_KEY)
+    pipeline.execute()
+    return len(rows)
+
+
+def incr_click_rank(news_id, amount=1):
+    """新闻被浏览后，增加排行中的点击量"""
+    try:
+        redis_store.zincrby(CLICK_RANK_KEY, news_id, amount)
+    except Exception as e:
+        current_app.logger.error(e)
+
+
+def add_click_rank(news_id, clicks):
+    """新闻审核通过后，加入点击排行"""
+    try:
+        redis_store.zadd(CLICK_RANK_KEY, clicks or 0, news_id)
+    except Exception as e:
+        current_app.logger.error(e)
+
+
+def remove_click_rank(news_id):
+    """新闻审核不通过时，从排行中移除"""
+    try:
+        redis_store.zrem(CLICK_RANK_KEY, news_id)
+    except Exception as e:
+        current_app.logger.error(e)
+
+
+def get_click_rank_list(count=constants.CLICK_RANK_MAX_NEWS):
+    """
+    获取点击排行前count条新闻的摘要数据
+    如果排行尚未初始化，或者redis不可用，回退到mysql查询
+
+    :param count: 新闻条数
+    :return: 新闻字典列表
+    """
+    news_ids = []
+    try:
+        news_ids = redis_store.zrevrange(CLICK_RANK_KEY, 0, count - 1)
+    except Exception as e:
+        current_app.logger.error(e)
+    if news_ids:
+        return get_news_many([int(news_id) for news_id in news_ids])
+    news_list = News.query.filter(News.status == 0).order_by(News.clicks.desc()).limit(count).all()
+    return [news.to_basic_dict() for news in news_list]
@@ -0,0 +1,199 @@
+# 评论点赞：点赞用户集合和点赞数量保存在redis中，使用lua脚本原子地点赞或取消点赞
+# 点赞记录先记入待写回的hash，由写回任务(manage.py flush_likes)批量保存到mysql
+# 点赞用户集合有效期为COMMENT_LIKERS_REDIS_EXPIRES，有未写回的记录时取消过期，写回后重新设置
+from flask import current_app
+from sqlalchemy import case
+
+from info import redis_store, db, constants
+from info.models import Comment, CommentLike
+from info.utils.redis_lock import acquire_lock, release_lock
+
+# 评论点赞数量，hash结构 评论id -> 点赞数量
+LIKE_COUNT_KEY = 'comment_like_count'
+# 等待写回的点赞记录，hash结构 "评论id:用户id" -> 1点赞/0取消点赞
+LIKE_PENDING_KEY = 'comment_like_pending'
+# 正在写回的点赞记录
+LIKE_FLUSHING_KEY = 'comment_like_flushing'
+# 写回任务的锁
+LIKE_FLUSH_LOCK_KEY = 'comment_like_flush_lock'
+# 点赞用户集合中的占位成员，用来区分"没有人点赞"和"未加载"
+PLACEHOLDER = '0'
+
+# 加载评论的点赞用户集合，集合已存在时不做修改
+# KEYS[1] 点赞用户集合 KEYS[2] 点赞数量hash
+# ARGV[1] 评论id ARGV[2] 有效期 ARGV[3...] 点赞用户id
+LOAD_SCRIPT = redis_store.register_script("""
+if redis.call('EXISTS', KEYS[1]) == 1 then
+    return 0
+end
+redis.call('SADD', KEYS[1], '0')
+for i = 3, #ARGV do
+    redis.call('SADD', KEYS[1], ARGV[i])
+end
+redis.call('EXPIRE', KEYS[1], ARGV[2])
+redis.call('HSET', KEYS[2], ARGV[1], #ARGV - 2)
+return 1
+""")
+
+# 点赞或取消点赞，返回{最新的点赞数量, 1点赞状态被修改/0未修改/-1集合未加载}
+# 状态被修改时取消集合的过期，避免未写回的点赞记录随集合过期丢失
+# KEYS[1] 点赞用户集合 KEYS[2] 点赞数量hash KEYS[3] 待写回hash
+# ARGV[1] 评论id ARGV[2] 用户id ARGV[3] 1点赞/0取消点赞
+TOGGLE_SCRIPT = redis_store.register_script("""
+if redis.call('EXISTS', KEYS[1]) == 0 then
+    return {0, -1}
+end
+local changed
+if ARGV[3] == '1' then
+    changed = redis.call('SADD', KEYS[1], ARGV[2])
+else
+    changed = redis.call('SREM', KEYS[1], ARGV[2])
+end
+if changed == 1 then
+    redis.call('PERSIST', KEYS[1])
+    redis.call('HSET', KEYS[3], ARGV[1] .. ':' .. ARGV[2], ARGV[3])
+    if ARGV[3] == '1' then
+        return {redis.call('HINCRBY', KEYS[2], ARGV[1], 1), 1}
+    end
+    return {redis.call('HINCRBY', KEYS[2], ARGV[1], -1), 1}
+end
+return {tonumber(redis.call('HGET', KEYS[2], ARGV[1]) or '0'), 0}
+""")
+
+
+def _likers_key(comment_id):
+    return 'comment_likers_%d' % comment_id
+
+
+def _ensure_loaded(comment_id):
+    """评论的点赞用户集合未加载时，从mysql加载"""
+    if redis_store.exists(_likers_key(comment_id)):
+        return
+    user_ids = [row.user_id for row in CommentLike.query.with_entities(CommentLike.user_id)
+                .filter(CommentLike.comment_id == comment_id).all()]
+    LOAD_SCRIPT(keys=[_likers_key(comment_id), LIKE_COUNT_KEY],
+                args=[comment_id, constants.COMMENT_LIKERS_REDIS_EXPIRES] + user_ids)
+
+
+def toggle_comment_like(comment_id, user_id, like):
+    """
+    点赞或取消点赞
+    重复点赞、重复取消点赞不会修改点赞数量
+
+    :param like: True点赞，False取消点赞
+    :return: (最新的点赞数量, 点赞状态是否被修改)
+    """
+    # 集合在加载后、点赞前过期时，重新加载
+    for _ in range(2):
+        _ensure_loaded(comment_id)
+        like_count, changed = TOGGLE_SCRIPT(keys=[_likers_key(comment_id), LIKE_COUNT_KEY, LIKE_PENDING_KEY],
+                                            args=[comment_id, user_id, 1 if like else 0])
+        if changed != -1:
+            return like_count, bool(changed)
+    raise RuntimeError('加载评论点赞用户失败')
+
+
+def get_like_states(comment_ids, user_id=None):
+    """
+    批量获取一页评论的点赞数量和当前用户是否点赞，redis使用一次pipeline
+    点赞用户集合未加载的评论，点赞状态以mysql为准，只需要一次查询
+
+    :return: (点赞数量字典 评论id -> 数量, 当前用户点赞的评论id集合)
+             点赞数量字典中只包含redis中有数据的评论
+    """
+    if not comment_ids:
+        return {}, set()
+    pipeline = redis_store.pipeline()
+    pipeline.hmget(LIKE_COUNT_KEY, comment_ids)
+    for comment_id in comment_ids:
+        pipeline.exists(_likers_key(comment_id))
+        if user_id:
+            pipeline.sismember(_likers_key(comment_id), user_id)
+    results = pipeline.execute()
+
+    like_counts = {}
+    for comment_id, count in zip(comment_ids, results[0]):
+        if count is not None:
+            like_counts[comment_id] = int(count)
+    like_ids = set()
+    if not user_id:
+        return like_counts, like_ids
+    uncached_ids = []
+    for index, comment_id in enumerate(comment_ids):
+        loaded, is_like = results[1 + index * 2], results[2 + index * 2]
+        if not loaded:
+            uncached_ids.append(comment_id)
+        elif is_like:
+            like_ids.add(comment_id)
+    if uncached_ids:
+        like_ids.update(row.comment_id for row in CommentLike.query.with_entities(CommentLike.comment_id)
+                        .filter(CommentLike.comment_id.in_(uncached_ids), CommentLike.user_id == user_id).all())
+    return like_counts, like_ids
+
+
+def apply_like_states(comment_dicts, user_id=None):
+    """用redis中的点赞数据更新序列化后的评论字典的like_count和is_like"""
+    like_counts, like_ids = get_like_states([comment['id'] for comment in comment_dicts], user_id)
+    for comment in comment_dicts:
+        comment['like_count'] = like_counts.get(comment['id'], comment['like_count'])
+        comment['is_like'] = comment['id'] in like_ids
+    return comment_dicts
+
+
+def flush_comment_likes(batch_size=constants.CLICK_FLUSH_BATCH_SIZE):
+    """
+    把redis中的点赞记录写回mysql
+    1、获取写回锁，把pending重命名为flushing
+    2、点赞的记录，插入mysql中不存在的CommentLike
+    3、取消点赞的记录，删除CommentLike
+    4、使用redis中的点赞数量批量更新Comment.like_count
+    5、提交成功后删除flushing，重新设置这些评论点赞用户集合的有效期，释放写回锁
+
+    :return: 写回的点赞记录数量
+    """
+    token = acquire_lock(LIKE_FLUSH_LOCK_KEY, constants.CLICK_FLUSH_LOCK_EXPIRES)
+    if not token:
+        return 0
+    try:
+        if not redis_store.exists(LIKE_FLUSHING_KEY):
+            if not redis_store.exists(LIKE_PENDING_KEY):
+                return 0
+            redis_store.rename(LIKE_PENDING_KEY, LIKE_FLUSHING_KEY)
+        pending = redis_store.hgetall(LIKE_FLUSHING_KEY)
+        adds, removes = [], []
+        for field, state in pending.items():
+            comment_id, user_id = [int(value) for value in field.split(':')]
+            (adds if state == '1' else removes).append((comment_id, user_id))
+        pair = db.tuple_(CommentLike.comment_id, CommentLike.user_id)
+        try:
+            for i in range(0, len(adds), batch_size):
+                batch = adds[i:i + batch_size]
+                exists = set(CommentLike.query.with_entities(CommentLike.comment_id, CommentLike.user_id)
+                             .filter(pair.in_(batch)).all())
+                rows = [{'comment_id': comment_id, 'user_id': user_id}
+                        for comment_id, user_id in batch if (comment_id, user_id) not in exists]
+                if rows:
+                    db.session.execute(CommentLike.__table__.insert(), rows)
+            for i in range(0, len(removes), batch_size):
+                CommentLike.query.filter(pair.in_(removes[i:i + batch_size])).delete(synchronize_session=False)
+            comment_ids = sorted(set(comment_id for comment_id, _ in adds + removes))
+            for i in range(0, len(comment_ids), batch_size):
+                batch_ids = comment_ids[i:i + batch_size]
+                counts = dict((comment_id, int(count or 0)) for comment_id, count
+                              in zip(batch_ids, redis_store.hmget(LIKE_COUNT_KEY, batch_ids)))
+                Comment.query.filter(Comment.id.in_(batch_ids)).update({
+                    Comment.like_count: case(counts, value=Comment.id, else_=Comment.like_count),
+                    Comment.update_time: Comment.update_time
+                }, synchronize_session=False)
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+        pipeline = redis_store.pipeline()
+        pipeline.delete(LIKE_FLUSHING_KEY)
+        for comment_id in comment_ids:
+            pipeline.expire(_likers_key(comment_id), constants.COMMENT_LIKERS_REDIS_EXPIRES)
+        pipeline.execute()
+        return len(pending)
+    finally:
+        release_lock(LIKE_FLUSH_LOCK_KEY, token)
@@ -15,19 +15,25 @@ def index_filter(index):
 # 装饰器：函数嵌套函数，闭包，在不改变函数原有代码的前提下，添加新的功能
 import functools
 
+def load_login_user():
+    """查询当前登录的用户，记录到g.user"""
+    # 使用请求上下文对象，获取user_id
+    user_id = session.get('user_id')
+    user = None
+    # 查询mysql，获取用户信息
+    try:
+        user = User.query.get(user_id)
+    except Exception as e:
+        current_app.logger.error(e)
+    # 使用应用上下文对象g,在请求过程中临时记录数据
+    g.user = user
+    return user
+
+
 def login_required(f):
     @functools.wraps(f)
     def wrapper(*args,**kwargs):
-        # 使用请求上下文对象，获取user_id
-        user_id = session.get('user_id')
-        user = None
-        # 查询mysql，获取用户信息
-        try:
-            user = User.query.get(user_id)
-        except Exception as e:
-            current_app.logger.error(e)
-        # 使用应用上下文对象g,在请求过程中临时记录数据
-        g.user = user
+        load_login_user()
         return f(*args,**kwargs)
     # wrapper.__name__ = f.__name__
     return wrapper
@@ -0,0 +1,119 @@
+# 条件请求：在执行视图之前计算廉价的版本号，客户端缓存的版本未变化时直接返回304
+# 完整响应带上ETag和Last-Modified，客户端下次请求时带上If-None-Match、If-Modified-Since
+import functools
+import hashlib
+import json
+import time
+from datetime import datetime
+
+from flask import request, session, current_app, make_response
+
+from info import redis_store, constants
+from info.utils.response_code import RET
+
+# 用户状态的版本号，hash结构 用户id -> 版本号，关注、取消关注时加1
+USER_VERSION_KEY = 'user_state_version'
+
+
+def user_part():
+    """
+    个性化页面的版本号需要包含当前登录用户和用户状态的版本号
+    读取session和redis，不查询mysql
+    """
+    user_id = session.get('user_id')
+    if not user_id:
+        return 'user:None'
+    return 'user:%s:%s' % (user_id, redis_store.hget(USER_VERSION_KEY, user_id) or 0)
+
+
+def bump_user_version(user_id):
+    """用户的关注等状态变化后调用，该用户缓存的个性化页面失效"""
+    try:
+        redis_store.hincrby(USER_VERSION_KEY, user_id, 1)
+    except Exception as e:
+        current_app.logger.error(e)
+
+
+def time_bucket(seconds=constants.FRAGMENT_CACHE_EXPIRES):
+    """
+    页面包含点击排行等按时间刷新的缓存片段时，版本号按缓存有效期分段，
+    客户端看到的旧数据不会超过片段缓存本身的有效期
+    """
+    return 'time:%d' % (time.time() // seconds)
+
+
+def _is_success(response):
+    """
+    响应是否为成功的结果，只有成功的结果才能设置ETag
+    出错时也返回状态码200和json，需要检查errno，避免客户端一直使用缓存的错误结果
+    """
+    if response.status_code != 200:
+        return False
+    if response.mimetype != 'application/json':
+        return True
+    try:
+        return json.loads(response.get_data(as_text=True)).get('errno') == RET.OK
+    except Exception:
+        return False
+
+
+def _not_modified(etag, last_modified):
+    if request.if_none_match:
+        return request.if_none_match.contains(etag)
+    if request.if_modified_since and last_modified:
+        return last_modified.replace(microsecond=0) <= request.if_modified_since
+    return False
+
+
+def conditional(version_func, always=None):
+    """
+    条件请求装饰器
+    1、调用version_func计算版本号，参数与视图函数相同
+       返回版本号，或(版本号, 最后修改时间)；返回None或计算失败时不处理条件请求
+    2、使用请求路径、查询参数和版本号生成ETag，与If-None-Match比较，
+       没有If-None-Match时用最后修改时间与If-Modified-Since比较
+    3、未修改时返回304，不执行视图函数
+    4、否则执行视图函数，状态码为200且不是出错的json(errno不为OK)时设置ETag、Last-Modified，
+       视图没有设置Cache-Control时设置no-cache，要求客户端每次使用前重新验证
+
+    :param version_func: 计算版本号的函数，只应读取redis中的版本号、计数等廉价数据
+    :param always: 无论是否返回304都要执行的函数，参数与视图函数相同，例如记录浏览量
+    """
+    def decorator(f):
+        @functools.wraps(f)
+        def wrapper(*args, **kwargs):
+            if always:
+                always(*args, **kwargs)
+            if request.method not in ('GET', 'HEAD'):
+                return f(*args, **kwargs)
+            try:
+                version = version_func(*args, **kwargs)
+            except Exception as e:
+                current_app.logger.error(e)
+                version = None
+            if version is None:
+                return f(*args, **kwargs)
+            last_modified = None
+            if isinstance(version, tuple):
+                version, last_modified = version
+            etag = hashlib.md5(('%s|%s' % (request.full_path, version)).encode()).hexdigest()
+
+            if _not_modified(etag, last_modified):
+                response = current_app.response_class(status=304)
+            else:
+                response = make_response(f(*args, **kwargs))
+                if not _is_success(response):
+                    return response
+                if not response.headers.get('Cache-Control'):
+                    response.cache_control.no_cache = True
+            response.set_etag(etag)
+            if last_modified:
+                response.last_modified = last_modified
+            return response
+        return wrapper
+    return decorator
+
+
+def timestamp_to_datetime(timestamp):
+    """redis中保存的时间戳转成Last-Modified使用的utc时间"""
+    return datetime.utcfromtimestamp(float(timestamp))
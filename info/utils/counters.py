@@ -0,0 +1,29 @@
+# 计数字段校对：使用关联子查询批量重新统计评论数、粉丝数、关注数和发布新闻数
+from info import db
+from info.models import User, News, Comment, tb_user_follows
+
+
+def recount_counters():
+    """
+    重新统计所有计数字段
+    每个表只执行一条update语句，update_time保持不变
+    """
+    News.query.update({
+        News.comments_count: db.select([db.func.count(Comment.id)])
+            .where(Comment.news_id == News.id).as_scalar(),
+        News.update_time: News.update_time
+    }, synchronize_session=False)
+    User.query.update({
+        User.followers_count: db.select([db.func.count()])
+            .where(tb_user_follows.c.followed_id == User.id).as_scalar(),
+        User.following_count: db.select([db.func.count()])
+            .where(tb_user_follows.c.follower_id == User.id).as_scalar(),
+        User.news_count: db.select([db.func.count(News.id)])
+            .where(News.user_id == User.id).as_scalar(),
+        User.update_time: User.update_time
+    }, synchronize_session=False)
+    try:
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
@@ -0,0 +1,54 @@
+# 游标分页：按(create_time, id)倒序定位下一页，不使用offset和count(*)
+from datetime import datetime
+
+from sqlalchemy import and_, or_
+
+# 游标中时间的格式
+CURSOR_TIME_FORMAT = '%Y%m%d%H%M%S'
+
+
+def encode_cursor(create_time, obj_id):
+    """生成游标字符串，格式：创建时间,id"""
+    return '%s,%d' % (create_time.strftime(CURSOR_TIME_FORMAT), obj_id)
+
+
+def decode_cursor(cursor):
+    """
+    解析游标字符串
+    空字符串表示第一页，返回None
+    格式错误抛出ValueError
+    """
+    if not cursor:
+        return None
+    create_time, obj_id = cursor.split(',')
+    return datetime.strptime(create_time, CURSOR_TIME_FORMAT), int(obj_id)
+
+
+def cursor_filter(model, cursor):
+    """生成游标之后(更早)的数据的过滤条件"""
+    create_time, obj_id = cursor
+    return or_(model.create_time < create_time,
+               and_(model.create_time == create_time, model.id < obj_id))
+
+
+def paginate_by_cursor(query, model, cursor, limit):
+    """
+    游标分页查询
+    多查询一条数据，用来判断是否还有下一页
+
+    :param query: 已添加过滤条件的查询对象
+    :param model: 模型类，需要有create_time和id字段
+    :param cursor: decode_cursor解析后的游标
+    :param limit: 每页数量
+    :return: (当前页数据, 下一页游标)，没有下一页时游标为None
+    """
+    if limit < 1:
+        raise ValueError('limit必须大于0')
+    if cursor:
+        query = query.filter(cursor_filter(model, cursor))
+    items = query.order_by(model.create_time.desc(), model.id.desc()).limit(limit + 1).all()
+    next_cursor = None
+    if len(items) > limit:
+        items = items[:limit]
+        next_cursor = encode_cursor(items[-1].create_time, items[-1].id)
+    return items, next_cursor
@@ -0,0 +1,109 @@
+# 实时评论推送：新评论、点赞数量变化发布到redis的频道，详情页通过Server-Sent Events接收
+# 每个进程只使用一个订阅连接，按新闻id把消息分发到每个客户端连接的队列
+# 需要运行在gevent等协程服务器上(live_server.py)，空闲连接只占用一个协程和一个队列
+import json
+import queue
+import threading
+import time
+
+from flask import current_app
+
+from info import redis_store, constants
+
+# 频道名前缀，每条新闻一个频道
+LIVE_CHANNEL_PREFIX = 'news_live_'
+
+
+class LiveHub(object):
+    """按新闻id管理客户端连接的消息队列，第一个客户端连接时启动订阅线程"""
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.queues = {}
+        self.thread = None
+
+    def subscribe(self, news_id):
+        q = queue.Queue(constants.LIVE_QUEUE_MAX)
+        with self.lock:
+            self.queues.setdefault(news_id, set()).add(q)
+            if self.thread is None:
+                self.thread = threading.Thread(target=self._run, args=(current_app._get_current_object(),),
+                                               name='news-live-listener')
+                self.thread.daemon = True
+                self.thread.start()
+        return q
+
+    def unsubscribe(self, news_id, q):
+        with self.lock:
+            queues = self.queues.get(news_id)
+            if queues:
+                queues.discard(q)
+                if not queues:
+                    del self.queues[news_id]
+
+    def count(self):
+        """当前进程的连接数量"""
+        with self.lock:
+            return sum(len(queues) for queues in self.queues.values())
+
+    def _dispatch(self, news_id, message):
+        with self.lock:
+            queues = list(self.queues.get(news_id, ()))
+        for q in queues:
+            try:
+                q.put_nowait(message)
+            except queue.Full:
+                pass
+
+    def _run(self, app):
+        while True:
+            try:
+                pubsub = redis_store.pubsub(ignore_subscribe_messages=True)
+                pubsub.psubscribe(LIVE_CHANNEL_PREFIX + '*')
+                for message in pubsub.listen():
+                    news_id = int(message['channel'][len(LIVE_CHANNEL_PREFIX):])
+                    self._dispatch(news_id, message['data'])
+            except Exception as e:
+                app.logger.error(e)
+                time.sleep(1)
+
+
+hub = LiveHub()
+
+
+def _publish(news_id, event, data):
+    try:
+        redis_store.publish(LIVE_CHANNEL_PREFIX + str(news_id), json.dumps({'event': event, 'data': data}))
+    except Exception as e:
+        current_app.logger.error(e)
+
+
+def publish_comment(news_id, comment_dict):
+    """发布新评论，评论作者只能包含to_public_dict中的公开数据"""
+    _publish(news_id, 'comment', comment_dict)
+
+
+def publish_like(news_id, comment_id, like_count):
+    """发布评论的点赞数量"""
+    _publish(news_id, 'like', {'comment_id': comment_id, 'like_count': like_count})
+
+
+def stream_events(news_id):
+    """
+    生成Server-Sent Events
+    1、订阅新闻的消息队列
+    2、收到消息时按事件类型发送，超过心跳间隔没有消息时发送注释行，连接断开时写入失败
+    3、连接断开后取消订阅
+    """
+    q = hub.subscribe(news_id)
+    try:
+        # 告诉浏览器断线后3秒重连
+        yield 'retry: 3000\n\n'
+        while True:
+            try:
+                message = json.loads(q.get(timeout=constants.LIVE_HEARTBEAT_SECONDS))
+            except queue.Empty:
+                yield ': ping\n\n'
+                continue
+            yield 'event: %s\ndata: %s\n\n' % (message['event'], json.dumps(message['data']))
+    finally:
+        hub.unsubscribe(news_id, q)
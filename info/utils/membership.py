@@ -0,0 +1,137 @@
+# 收藏、关注关系判断：不再遍历lazy="dynamic"关系的全部数据
+# redis中缓存每个用户收藏的新闻id集合、关注的用户id集合，使用sismember判断
+# 集合未缓存时使用exists查询判断，并从mysql加载集合
+from flask import current_app
+
+from info import redis_store, db, constants
+from info.models import tb_user_collection, tb_user_follows
+
+# 集合中的占位成员，用来区分"没有数据"和"未缓存"
+PLACEHOLDER = '0'
+
+# 集合已缓存时添加或删除成员，并刷新有效期；未缓存时不做修改
+# KEYS[1] 集合 ARGV[1] 成员id ARGV[2] 1添加/0删除 ARGV[3] 有效期
+SYNC_SCRIPT = redis_store.register_script("""
+if redis.call('EXISTS', KEYS[1]) == 0 then
+    return 0
+end
+if ARGV[2] == '1' then
+    redis.call('SADD', KEYS[1], ARGV[1])
+else
+    redis.call('SREM', KEYS[1], ARGV[1])
+end
+redis.call('EXPIRE', KEYS[1], ARGV[3])
+return 1
+""")
+
+
+def _collection_key(user_id):
+    return 'user_collection_%d' % user_id
+
+
+def _followed_key(user_id):
+    return 'user_followed_%d' % user_id
+
+
+def _is_member(key, member_id, column, owner_filter):
+    """
+    判断member_id是否在集合中
+    1、集合已缓存，使用sismember判断
+    2、否则使用exists查询判断，并加载集合到redis；redis不可用时只使用exists查询
+
+    :param column: 成员id所在的列
+    :param owner_filter: 筛选当前用户数据的过滤条件
+    """
+    warm = True
+    try:
+        pipeline = redis_store.pipeline()
+        pipeline.exists(key)
+        pipeline.sismember(key, member_id)
+        cached, is_member = pipeline.execute()
+        if cached:
+            return bool(is_member)
+    except Exception as e:
+        current_app.logger.error(e)
+        warm = False
+
+    is_member = db.session.query(db.session.query(column).filter(owner_filter, column == member_id).exists()).scalar()
+    if warm:
+        try:
+            member_ids = [row[0] for row in db.session.query(column).filter(owner_filter).all()]
+            pipeline = redis_store.pipeline()
+            pipeline.delete(key)
+            pipeline.sadd(key, PLACEHOLDER, *member_ids)
+            pipeline.expire(key, constants.MEMBERSHIP_REDIS_EXPIRES)
+            pipeline.execute()
+        except Exception as e:
+            current_app.logger.error(e)
+    return is_member
+
+
+def _sync(key, member_id, is_member):
+    """
+    关系修改提交后，同步已缓存的集合，未缓存的集合等下次判断时再加载
+    判断集合存在和修改集合在同一个lua脚本中执行，集合在两步之间过期时不会生成缺少占位成员的集合
+    """
+    try:
+        SYNC_SCRIPT(keys=[key], args=[member_id, 1 if is_member else 0, constants.MEMBERSHIP_REDIS_EXPIRES])
+    except Exception as e:
+        current_app.logger.error(e)
+
+
+def _check_member(key, member_id, column, owner_filter):
+    """
+    修改关系前使用mysql判断member_id是否在集合中，不信任redis缓存
+    缓存的集合可能由旧的事务快照加载，与mysql不一致时删除缓存，下次判断时重新加载
+    """
+    is_member = db.session.query(db.session.query(column).filter(owner_filter, column == member_id).exists()).scalar()
+    try:
+        pipeline = redis_store.pipeline()
+        pipeline.exists(key)
+        pipeline.sismember(key, member_id)
+        cached, cached_member = pipeline.execute()
+        if cached and bool(cached_member) != bool(is_member):
+            redis_store.delete(key)
+    except Exception as e:
+        current_app.logger.error(e)
+    return is_member
+
+
+def is_collected(user_id, news_id, exact=False):
+    """
+    判断用户是否收藏了新闻
+    exact为True时使用mysql判断，用于收藏、取消收藏前的判断；页面展示使用redis缓存
+    """
+    if exact:
+        return _check_member(_collection_key(user_id), news_id,
+                             tb_user_collection.c.news_id, tb_user_collection.c.user_id == user_id)
+    return _is_member(_collection_key(user_id), news_id,
+                      tb_user_collection.c.news_id, tb_user_collection.c.user_id == user_id)
+
+
+def get_collect_time(user_id, news_id):
+    """获取用户收藏新闻的时间，未收藏时返回None"""
+    return db.session.query(tb_user_collection.c.create_time) \
+        .filter(tb_user_collection.c.user_id == user_id, tb_user_collection.c.news_id == news_id).scalar()
+
+
+def is_following(user_id, other_id, exact=False):
+    """
+    判断用户是否关注了另一个用户
+    exact为True时使用mysql判断，用于关注、取消关注前的判断；页面展示使用redis缓存
+    """
+    if exact:
+        return _check_member(_followed_key(user_id), other_id,
+                             tb_user_follows.c.followed_id, tb_user_follows.c.follower_id == user_id)
+    return _is_member(_followed_key(user_id), other_id,
+                      tb_user_follows.c.followed_id, tb_user_follows.c.follower_id == user_id)
+
+
+def sync_collection(user_id, news_id, collected):
+    """收藏或取消收藏提交后调用"""
+    _sync(_collection_key(user_id), news_id, collected)
+
+
+def sync_following(user_id, other_id, following):
+    """关注或取消关注提交后调用"""
+    _sync(_followed_key(user_id), other_id, following)
@@ -0,0 +1,211 @@
+# 新闻数据缓存：按新闻id缓存序列化后的新闻字典
+# 第一级为进程内的LRU缓存，第二级为redis，都未命中时查询mysql
+# 新闻被修改时删除redis缓存，并通过redis的发布订阅通知所有进程删除进程内缓存
+import json
+import threading
+import time
+from collections import OrderedDict
+
+from flask import current_app
+
+from info import redis_store, constants
+from info.models import News
+
+# 通知各进程删除进程内缓存的频道
+NEWS_CACHE_CHANNEL = 'news_cache_invalidate'
+# 新闻的版本号，hash结构 新闻id -> 版本号
+NEWS_VERSION_KEY = 'news_version'
+
+# 缓存的新闻数据类型 -> redis缓存有效期
+# basic为to_basic_dict，detail为to_dict并附加新闻状态status
+NEWS_CACHE_KINDS = {
+    'basic': constants.NEWS_SUMMARY_REDIS_EXPIRES,
+    'detail': constants.NEWS_DETAIL_REDIS_EXPIRES,
+}
+
+
+class LRUCache(object):
+    """进程内的LRU缓存，数据超过有效期或超过最大条数时淘汰"""
+    def __init__(self, max_size, expires):
+        self.max_size = max_size
+        self.expires = expires
+        self.data = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key):
+        with self.lock:
+            item = self.data.get(key)
+            if item is None or item[0] < time.time():
+                if item is not None:
+                    del self.data[key]
+                self.misses += 1
+                return None
+            self.data.move_to_end(key)
+            self.hits += 1
+            return item[1]
+
+    def set(self, key, value):
+        with self.lock:
+            self.data[key] = (time.time() + self.expires, value)
+            self.data.move_to_end(key)
+            while len(self.data) > self.max_size:
+                self.data.popitem(last=False)
+                self.evictions += 1
+
+    def delete(self, key):
+        with self.lock:
+            self.data.pop(key, None)
+
+    def stats(self):
+        return {
+            'size': len(self.data),
+            'max_size': self.max_size,
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions
+        }
+
+
+local_cache = LRUCache(constants.NEWS_LOCAL_CACHE_MAX, constants.NEWS_LOCAL_CACHE_EXPIRES)
+# redis缓存的命中统计
+redis_stats = {'hits': 0, 'misses': 0}
+
+
+def _cache_key(kind, news_id):
+    return 'news_%s_%s' % (kind, news_id)
+
+
+def _load_news(kind, news_ids):
+    """从mysql加载新闻数据"""
+    news_list = News.query.filter(News.id.in_(news_ids)).all()
+    if kind == 'basic':
+        return dict((news.id, news.to_basic_dict()) for news in news_list)
+    news_dict_map = {}
+    for news, news_dict in zip(news_list, News.serialize_many(news_list)):
+        news_dict['status'] = news.status
+        news_dict_map[news.id] = news_dict
+    return news_dict_map
+
+
+def get_news_many(news_ids, kind='basic'):
+    """
+    根据新闻id列表批量获取新闻字典
+    1、读取进程内缓存
+    2、未命中的新闻id，使用mget一次性读取redis缓存
+    3、仍未命中的新闻id，使用一条in查询从mysql加载，并写回redis
+    4、按照传入id的顺序返回，不存在的新闻直接跳过
+
+    :param news_ids: 新闻id列表
+    :param kind: 新闻数据类型，basic或detail
+    :return: 新闻字典列表
+    """
+    if not news_ids:
+        return []
+    news_dict_map = {}
+    for news_id in news_ids:
+        news_dict = local_cache.get(_cache_key(kind, news_id))
+        if news_dict is not None:
+            news_dict_map[news_id] = news_dict
+
+    missing_ids = [news_id for news_id in news_ids if news_id not in news_dict_map]
+    if missing_ids:
+        try:
+            cached = redis_store.mget([_cache_key(kind, news_id) for news_id in missing_ids])
+        except Exception as e:
+            current_app.logger.error(e)
+            cached = [None] * len(missing_ids)
+        for news_id, value in zip(missing_ids, cached):
+            if value:
+                news_dict_map[news_id] = json.loads(value)
+                local_cache.set(_cache_key(kind, news_id), news_dict_map[news_id])
+                redis_stats['hits'] += 1
+            else:
+                redis_stats['misses'] += 1
+
+    missing_ids = [news_id for news_id in missing_ids if news_id not in news_dict_map]
+    if missing_ids:
+        loaded = _load_news(kind, missing_ids)
+        news_dict_map.update(loaded)
+        try:
+            pipeline = redis_store.pipeline()
+            for news_id, news_dict in loaded.items():
+                pipeline.setex(_cache_key(kind, news_id), NEWS_CACHE_KINDS[kind],
+                               json.dumps(news_dict, ensure_ascii=False))
+                local_cache.set(_cache_key(kind, news_id), news_dict)
+            pipeline.execute()
+        except Exception as e:
+            current_app.logger.error(e)
+
+    # 返回副本，避免调用方修改缓存中的数据
+    return [dict(news_dict_map[news_id]) for news_id in news_ids if news_id in news_dict_map]
+
+
+def get_news_version(news_id):
+    """获取新闻的版本号，新闻数据每次修改版本号加1，用于生成页面缓存的键名"""
+    try:
+        return int(redis_store.hget(NEWS_VERSION_KEY, news_id) or 0)
+    except Exception as e:
+        current_app.logger.error(e)
+        return None
+
+
+def bump_news_version(news_id):
+    """新闻页面展示的数据(例如评论点赞数)变化，但新闻数据不变时，只增加版本号"""
+    try:
+        redis_store.hincrby(NEWS_VERSION_KEY, news_id, 1)
+    except Exception as e:
+        current_app.logger.error(e)
+
+
+def delete_news_cache(news_id):
+    """新闻数据修改后，删除redis缓存，增加版本号，并通知所有进程删除进程内缓存"""
+    delete_news_cache_many([news_id])
+
+
+def delete_news_cache_many(news_ids):
+    """批量删除多条新闻的缓存，redis使用一次pipeline"""
+    if not news_ids:
+        return
+    for news_id in news_ids:
+        for kind in NEWS_CACHE_KINDS:
+            local_cache.delete(_cache_key(kind, news_id))
+    try:
+        pipeline = redis_store.pipeline()
+        pipeline.delete(*[_cache_key(kind, news_id) for news_id in news_ids for kind in NEWS_CACHE_KINDS])
+        for news_id in news_ids:
+            pipeline.hincrby(NEWS_VERSION_KEY, news_id, 1)
+            pipeline.publish(NEWS_CACHE_CHANNEL, news_id)
+        pipeline.execute()
+    except Exception as e:
+        current_app.logger.error(e)
+
+
+def get_news_cache_stats():
+    """获取当前进程的缓存命中统计"""
+    return {
+        'local': local_cache.stats(),
+        'redis': dict(redis_stats)
+    }
+
+
+def start_invalidation_listener(app):
+    """启动后台线程，订阅缓存失效通知，删除进程内缓存"""
+    def run():
+        while True:
+            try:
+                pubsub = redis_store.pubsub(ignore_subscribe_messages=True)
+                pubsub.subscribe(NEWS_CACHE_CHANNEL)
+                for message in pubsub.listen():
+                    for kind in NEWS_CACHE_KINDS:
+                        local_cache.delete(_cache_key(kind, message['data']))
+            except Exception as e:
+                app.logger.error(e)
+                time.sleep(1)
+
+    thread = threading.Thread(target=run, name='news-cache-listener')
+    thread.daemon = True
+    thread.start()
+    return thread
@@ -0,0 +1,126 @@
+# 首页最新新闻列表：在redis的list中按分类缓存最新审核通过的新闻id
+# 分类id为1的"最新"分类缓存全部分类的最新新闻
+# 前几页直接从redis读取id，再通过新闻缓存获取数据，翻页超出缓存范围才查询mysql
+import time
+from datetime import datetime
+
+from flask import current_app
+
+from info import redis_store, constants
+from info.models import News, Category
+from info.utils.cursor import encode_cursor
+from info.utils.news_cache import get_news_many
+
+# 最新分类的id
+LATEST_CATEGORY_ID = 1
+# 各分类最新新闻列表的刷新时间，hash结构 分类id -> 时间戳，用作新闻列表的版本号
+LATEST_UPDATED_KEY = 'news_latest_updated'
+
+
+def _latest_key(cid):
+    return 'news_latest_%d' % cid
+
+
+def refresh_latest_news(*category_ids):
+    """
+    从mysql重新加载分类的最新新闻id列表，"最新"分类总是一起刷新
+    新闻审核、编辑时调用，新闻的发布时间不一定最新，因此整体重建而不是lpush
+    """
+    category_ids = set(int(cid) for cid in category_ids if cid) | {LATEST_CATEGORY_ID}
+    try:
+        pipeline = redis_store.pipeline()
+        for cid in category_ids:
+            filters = [News.status == 0]
+            if cid != LATEST_CATEGORY_ID:
+                filters.append(News.category_id == cid)
+            rows = News.query.with_entities(News.id).filter(*filters) \
+                .order_by(News.create_time.desc(), News.id.desc()) \
+                .limit(constants.NEWS_LATEST_MAX).all()
+            key = _latest_key(cid)
+            pipeline.delete(key)
+            if rows:
+                pipeline.rpush(key, *[row.id for row in rows])
+            pipeline.hset(LATEST_UPDATED_KEY, cid, time.time())
+        pipeline.execute()
+    except Exception as e:
+        current_app.logger.error(e)
+
+
+def seed_latest_news():
+    """重建所有分类的最新新闻id列表"""
+    category_ids = [category.id for category in Category.query.all()]
+    refresh_latest_news(*category_ids)
+    return len(category_ids)
+
+
+def get_latest_updated(cid):
+    """
+    获取分类最新新闻列表的刷新时间
+    还没有刷新过时以当前时间为准，之后的请求都使用这个时间
+
+    :return: 时间戳，redis不可用时返回None
+    """
+    try:
+        redis_store.hsetnx(LATEST_UPDATED_KEY, cid, time.time())
+        return float(redis_store.hget(LATEST_UPDATED_KEY, cid))
+    except Exception as e:
+        current_app.logger.error(e)
+        return None
+
+
+def get_latest_news_page(cid, page, per_page, kind='basic'):
+    """
+    按页码从redis读取最新新闻
+    kind为新闻缓存的数据类型，basic或detail
+
+    :return: (新闻字典列表, 缓存中的新闻总数)，
+             超出缓存范围或缓存不存在时返回None，由调用方查询mysql
+    """
+    start = (page - 1) * per_page
+    end = start + per_page - 1
+    if page < 1 or per_page < 1 or end >= constants.NEWS_LATEST_MAX:
+        return None
+    key = _latest_key(cid)
+    try:
+        pipeline = redis_store.pipeline()
+        pipeline.lrange(key, start, end)
+        pipeline.llen(key)
+        news_ids, total = pipeline.execute()
+    except Exception as e:
+        current_app.logger.error(e)
+        return None
+    if not total:
+        return None
+    return get_news_many([int(news_id) for news_id in news_ids], kind), total
+
+
+def get_latest_news_by_cursor(cid, cursor, per_page, kind='basic'):
+    """
+    按游标从redis读取最新新闻，游标中的新闻id必须在缓存中
+    kind为新闻缓存的数据类型，basic或detail
+
+    :return: (新闻字典列表, 下一页游标)，无法从缓存中读取时返回None
+    """
+    try:
+        news_ids = [int(news_id) for news_id in redis_store.lrange(_latest_key(cid), 0, -1)]
+    except Exception as e:
+        current_app.logger.error(e)
+        return None
+    if not news_ids:
+        return None
+    start = 0
+    if cursor:
+        if cursor[1] not in news_ids:
+            return None
+        start = news_ids.index(cursor[1]) + 1
+    page_ids = news_ids[start:start + per_page]
+    if not page_ids:
+        return None
+    news_dict_list = get_news_many(page_ids, kind)
+    next_cursor = None
+    # 缓存已满时，缓存之外还有更早的新闻
+    has_more = start + per_page < len(news_ids) or len(news_ids) >= constants.NEWS_LATEST_MAX
+    if has_more and news_dict_list:
+        last = news_dict_list[-1]
+        next_cursor = encode_cursor(datetime.strptime(last['create_time'], '%Y-%m-%d %H:%M:%S'), last['id'])
+    return news_dict_list, next_cursor
@@ -0,0 +1,71 @@
+# 页面缓存：在redis中缓存渲染好的整页或页面片段html
+# 缓存过期后只有拿到锁的进程重新渲染，其他进程继续返回旧的html，避免同时渲染
+import time
+
+from flask import current_app
+
+from info import redis_store, constants
+
+# 没有旧的html时，等待其他进程渲染的最长时间，单位：秒
+RENDER_WAIT_SECONDS = 2
+
+
+def _save(key, expires, html):
+    try:
+        pipeline = redis_store.pipeline()
+        pipeline.setex(key, expires + constants.PAGE_CACHE_STALE_EXPIRES, html)
+        pipeline.setex(key + '_fresh', expires, 1)
+        pipeline.delete(key + '_lock')
+        pipeline.execute()
+    except Exception as e:
+        current_app.logger.error(e)
+
+
+def get_or_render(key, expires, render):
+    """
+    获取缓存的html，缓存过期时重新渲染
+    1、html的保存时间为有效期加上PAGE_CACHE_STALE_EXPIRES，另用key_fresh标记是否在有效期内
+    2、在有效期内，直接返回缓存的html
+    3、已过期，拿到渲染锁的进程重新渲染并写入缓存
+    4、没拿到锁的进程返回旧的html；没有旧的html时等待渲染完成
+    5、redis不可用时直接渲染
+
+    :param key: 缓存的键名
+    :param expires: 有效期，单位：秒
+    :param render: 渲染函数，返回html字符串
+    :return: html字符串
+    """
+    try:
+        pipeline = redis_store.pipeline()
+        pipeline.get(key)
+        pipeline.exists(key + '_fresh')
+        html, is_fresh = pipeline.execute()
+        if html is not None and is_fresh:
+            return html
+        locked = redis_store.set(key + '_lock', 1, ex=RENDER_WAIT_SECONDS * 5, nx=True)
+    except Exception as e:
+        current_app.logger.error(e)
+        return render()
+
+    if locked:
+        try:
+            html = render()
+        except Exception:
+            redis_store.delete(key + '_lock')
+            raise
+        _save(key, expires, html)
+        return html
+    if html is not None:
+        return html
+    # 第一次渲染，没有旧的html，等待拿到锁的进程渲染完成
+    deadline = time.time() + RENDER_WAIT_SECONDS
+    while time.time() < deadline:
+        time.sleep(0.05)
+        try:
+            html = redis_store.get(key)
+        except Exception as e:
+            current_app.logger.error(e)
+            break
+        if html is not None:
+            return html
+    return render()
@@ -0,0 +1,32 @@
+# redis分布式锁：加锁时写入随机令牌，释放时只删除自己持有的锁
+# 持有锁的进程执行过慢、锁已过期被其他进程获取时，不会误删其他进程的锁
+import uuid
+
+from info import redis_store
+
+# 锁的值等于令牌时才删除
+# KEYS[1] 锁 ARGV[1] 令牌
+RELEASE_SCRIPT = redis_store.register_script("""
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('DEL', KEYS[1])
+end
+return 0
+""")
+
+
+def acquire_lock(key, expires):
+    """
+    获取锁
+
+    :param expires: 锁的有效期，单位：秒
+    :return: 令牌，获取失败时返回None
+    """
+    token = uuid.uuid4().hex
+    if redis_store.set(key, token, ex=expires, nx=True):
+        return token
+    return None
+
+
+def release_lock(key, token):
+    """释放锁，锁已过期或被其他进程持有时不做修改"""
+    RELEASE_SCRIPT(keys=[key], args=[token])
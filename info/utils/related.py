@@ -0,0 +1,200 @@
+# 相关新闻：由离线任务(manage.py related)计算，保存在redis的hash中 新闻id -> "相关新闻id,相关新闻id,..."
+# 详情页只需要一次hget，不在请求中计算相似度
+# 每条新闻用两部分向量表示，按权重拼接后求余弦相似度：
+#   1、标题和摘要的词频向量，词通过crc32哈希到固定维度，按tf-idf加权
+#   2、收藏该新闻的用户向量，用户id哈希到固定维度
+# 向量使用scipy的稀疏矩阵，内存占用与词和收藏的数量成正比，与哈希维度无关
+import zlib
+from collections import Counter
+
+from flask import current_app
+
+from info import redis_store, db, constants
+from info.models import News, tb_user_collection
+from info.utils.search import tokenize
+
+# 每条新闻的相关新闻id，hash结构 新闻id -> 逗号分隔的新闻id
+RELATED_KEY = 'news_related'
+# 每条新闻第K个相关新闻的相似度，增量计算时判断新的新闻能否进入相关新闻
+RELATED_SCORE_KEY = 'news_related_score'
+# 等待增量计算的新闻id集合，新闻审核、编辑后加入
+RELATED_PENDING_KEY = 'news_related_pending'
+
+# 词向量、用户向量的哈希维度
+TEXT_DIM = 4096
+COLLECT_DIM = 1024
+# 每次计算相似度的新闻数量，控制相似度矩阵的内存占用
+BLOCK_SIZE = 256
+
+
+def mark_related_pending(news_id):
+    """新闻审核或编辑后，等待下次任务增量计算"""
+    try:
+        redis_store.sadd(RELATED_PENDING_KEY, news_id)
+    except Exception as e:
+        current_app.logger.error(e)
+
+
+def get_related_ids(news_id):
+    """获取新闻的相关新闻id列表"""
+    try:
+        value = redis_store.hget(RELATED_KEY, news_id)
+    except Exception as e:
+        current_app.logger.error(e)
+        return []
+    return [int(related_id) for related_id in value.split(',')] if value else []
+
+
+def _normalize(np, sp, matrix, weight):
+    """每行归一化后乘以sqrt(权重)，拼接后两行的点积为两部分余弦相似度的加权和"""
+    norms = np.sqrt(np.asarray(matrix.multiply(matrix).sum(axis=1)).ravel())
+    norms[norms == 0] = 1
+    return sp.diags(np.sqrt(weight) / norms) @ matrix
+
+
+def _build_matrix(np, sp):
+    """
+    加载全部审核通过的新闻，生成新闻向量的稀疏矩阵
+    每行是一条新闻的向量，已归一化，两行的点积即相关度
+
+    :return: (新闻id数组, csr格式的向量矩阵)
+    """
+    rows = News.query.with_entities(News.id, News.title, News.digest).filter(News.status == 0) \
+        .order_by(News.id).all()
+    news_ids = np.array([row.id for row in rows], dtype=np.int64)
+    index = dict((news_id, i) for i, news_id in enumerate(news_ids.tolist()))
+
+    row_index, col_index, values = [], [], []
+    for i, row in enumerate(rows):
+        counts = Counter(zlib.crc32(token.encode()) % TEXT_DIM
+                         for token in tokenize('%s %s' % (row.title, row.digest or '')))
+        row_index.extend([i] * len(counts))
+        col_index.extend(counts.keys())
+        values.extend(counts.values())
+    text = sp.csr_matrix((np.array(values, dtype=np.float32), (row_index, col_index)),
+                         shape=(len(rows), TEXT_DIM))
+    # 逆文档频率加权
+    df = np.bincount(text.indices, minlength=TEXT_DIM)
+    text = text @ sp.diags(np.log((len(rows) + 1) / (df + 1)).astype(np.float32))
+
+    row_index, col_index = [], []
+    pairs = db.session.query(tb_user_collection.c.news_id, tb_user_collection.c.user_id).all()
+    for news_id, user_id in pairs:
+        if news_id in index:
+            row_index.append(index[news_id])
+            col_index.append(user_id % COLLECT_DIM)
+    collect = sp.csr_matrix((np.ones(len(row_index), dtype=np.float32), (row_index, col_index)),
+                            shape=(len(rows), COLLECT_DIM))
+    # 哈希冲突时同一位置累加，收藏向量只记录是否收藏
+    collect.data[:] = 1
+
+    text = _normalize(np, sp, text, constants.RELATED_TEXT_WEIGHT)
+    collect = _normalize(np, sp, collect, constants.RELATED_COLLECT_WEIGHT)
+    return news_ids, sp.hstack([text, collect]).tocsr()
+
+
+def _top_k(np, news_ids, matrix, rows):
+    """
+    计算指定行的相关新闻
+    1、分块计算与全部新闻的相似度，结果为稀疏矩阵，只包含相似度不为0的新闻
+    2、排除新闻自身和相似度不大于0的新闻
+    3、argpartition取前K个，再按相似度排序
+
+    :return: 生成 (新闻id, 相关新闻id列表, 第K个相关新闻的相似度)
+    """
+    k = min(constants.RELATED_MAX_COUNT, len(news_ids) - 1)
+    if k < 1:
+        return
+    for start in range(0, len(rows), BLOCK_SIZE):
+        block = rows[start:start + BLOCK_SIZE]
+        scores = (matrix[block] @ matrix.T).tocsr()
+        for i, row in enumerate(block):
+            cols = scores.indices[scores.indptr[i]:scores.indptr[i + 1]]
+            values = scores.data[scores.indptr[i]:scores.indptr[i + 1]]
+            mask = (cols != row) & (values > 0)
+            cols, values = cols[mask], values[mask]
+            if len(values) > k:
+                top = np.argpartition(-values, k - 1)[:k]
+                cols, values = cols[top], values[top]
+            order = np.argsort(-values)
+            cols, values = cols[order], values[order]
+            related = [int(news_ids[col]) for col in cols]
+            # 相关新闻不足K个时，任何相似度大于0的新闻都可以进入
+            threshold = float(values[-1]) if len(related) == k else 0.0
+            yield int(news_ids[row]), related, threshold
+
+
+def _save(np, news_ids, matrix, rows, related_key, score_key):
+    pipeline = redis_store.pipeline()
+    for news_id, related, threshold in _top_k(np, news_ids, matrix, rows):
+        if related:
+            pipeline.hset(related_key, news_id, ','.join(str(related_id) for related_id in related))
+            pipeline.hset(score_key, news_id, threshold)
+        else:
+            pipeline.hdel(related_key, news_id)
+            pipeline.hdel(score_key, news_id)
+    pipeline.execute()
+
+
+def compute_related(full=False):
+    """
+    计算相关新闻
+    全量计算：计算全部新闻，写入临时键后rename
+    增量计算：
+    1、取出等待计算的新闻id，已不是审核通过状态的新闻删除相关新闻
+    2、计算审核通过的新闻的相关新闻
+    3、与这些新闻的相似度超过原来第K个相关新闻的新闻，重新计算
+    4、相关新闻中包含已删除新闻的新闻，重新计算
+
+    :return: 计算的新闻数量
+    """
+    # numpy、scipy只有离线任务需要，web进程导入本模块时不依赖它们
+    import numpy as np
+    import scipy.sparse as sp
+
+    pending = [int(news_id) for news_id in redis_store.smembers(RELATED_PENDING_KEY)]
+    if not full and not pending:
+        return 0
+    news_ids, matrix = _build_matrix(np, sp)
+    index = dict((news_id, i) for i, news_id in enumerate(news_ids.tolist()))
+
+    if full:
+        rows = np.arange(len(news_ids))
+        pipeline = redis_store.pipeline()
+        pipeline.delete(RELATED_KEY + '_tmp', RELATED_SCORE_KEY + '_tmp')
+        pipeline.execute()
+        _save(np, news_ids, matrix, rows, RELATED_KEY + '_tmp', RELATED_SCORE_KEY + '_tmp')
+        pipeline = redis_store.pipeline()
+        for key in (RELATED_KEY, RELATED_SCORE_KEY):
+            if redis_store.exists(key + '_tmp'):
+                pipeline.rename(key + '_tmp', key)
+            else:
+                pipeline.delete(key)
+        if pending:
+            pipeline.srem(RELATED_PENDING_KEY, *pending)
+        pipeline.execute()
+        return len(rows)
+
+    new_rows = [index[news_id] for news_id in pending if news_id in index]
+    removed = set(news_id for news_id in pending if news_id not in index)
+    affected = set(new_rows)
+    if new_rows:
+        thresholds = redis_store.hgetall(RELATED_SCORE_KEY)
+        threshold = np.array([float(thresholds.get(str(news_id), 0)) for news_id in news_ids.tolist()],
+                             dtype=np.float32)
+        for start in range(0, len(new_rows), BLOCK_SIZE):
+            scores = (matrix[new_rows[start:start + BLOCK_SIZE]] @ matrix.T).max(axis=0).toarray().ravel()
+            affected.update(np.nonzero(scores > threshold)[0].tolist())
+    if removed:
+        pipeline = redis_store.pipeline()
+        for news_id in removed:
+            pipeline.hdel(RELATED_KEY, news_id)
+            pipeline.hdel(RELATED_SCORE_KEY, news_id)
+        pipeline.execute()
+        for news_id, value in redis_store.hgetall(RELATED_KEY).items():
+            if removed & set(int(related_id) for related_id in value.split(',')) and int(news_id) in index:
+                affected.add(index[int(news_id)])
+    if affected:
+        _save(np, news_ids, matrix, np.array(sorted(affected)), RELATED_KEY, RELATED_SCORE_KEY)
+    redis_store.srem(RELATED_PENDING_KEY, *pending)
+    return len(affected)
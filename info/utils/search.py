@@ -0,0 +1,166 @@
+# 新闻全文搜索：倒排索引保存在redis中
+# 中文按相邻两个字切分为二元词，英文和数字按单词切分
+# 每个词对应一个有序集合 新闻id -> 词的权重，标题、摘要、正文的权重依次降低
+import hashlib
+import math
+import re
+from collections import Counter
+from html import unescape
+
+from flask import current_app
+
+from info import redis_store, constants
+from info.models import News
+
+# 已建立索引的新闻id集合
+SEARCH_DOCS_KEY = 'search_docs'
+
+# 标题、摘要、正文中出现一次的权重
+FIELD_WEIGHTS = (('title', 3), ('digest', 2), ('content', 1))
+# 词频饱和参数，词频越高，权重增长越慢
+TF_SATURATION = 1.2
+
+_TOKEN_RE = re.compile(r'[a-z0-9]+|[一-鿿]+')
+_TAG_RE = re.compile(r'<[^>]+>')
+
+
+def tokenize(text):
+    """
+    切分文本
+    1、英文转成小写，英文和数字按单词切分
+    2、连续的中文按相邻两个字切分，只有一个字时保留单字
+
+    :return: 词列表，可能有重复
+    """
+    tokens = []
+    for run in _TOKEN_RE.findall((text or '').lower()):
+        if run[0] < '一' or len(run) == 1:
+            tokens.append(run)
+        else:
+            tokens.extend(run[i:i + 2] for i in range(len(run) - 1))
+    return tokens
+
+
+def strip_html(html):
+    """去除正文中的html标签"""
+    return unescape(_TAG_RE.sub(' ', html or ''))
+
+
+def _term_key(term):
+    return 'search_term_%s' % term
+
+
+def _doc_key(news_id):
+    return 'search_doc_%d' % news_id
+
+
+def _term_weights(news):
+    """计算新闻中每个词的权重"""
+    freqs = Counter()
+    for field, weight in FIELD_WEIGHTS:
+        text = getattr(news, field)
+        if field == 'content':
+            text = strip_html(text)
+        for token in tokenize(text):
+            freqs[token] += weight
+    return dict((term, freq * (TF_SATURATION + 1) / (freq + TF_SATURATION)) for term, freq in freqs.items())
+
+
+def remove_news_index(news_id):
+    """从倒排索引中删除新闻"""
+    try:
+        terms = redis_store.smembers(_doc_key(news_id))
+        pipeline = redis_store.pipeline()
+        for term in terms:
+            pipeline.zrem(_term_key(term), news_id)
+        pipeline.delete(_doc_key(news_id))
+        pipeline.srem(SEARCH_DOCS_KEY, news_id)
+        pipeline.execute()
+    except Exception as e:
+        current_app.logger.error(e)
+
+
+def index_news(news):
+    """
+    建立或更新新闻的索引
+    只有审核通过的新闻才建立索引，其他状态从索引中删除
+    """
+    remove_news_index(news.id)
+    if news.status != 0:
+        return
+    weights = _term_weights(news)
+    try:
+        pipeline = redis_store.pipeline()
+        for term, weight in weights.items():
+            pipeline.zadd(_term_key(term), weight, news.id)
+        if weights:
+            pipeline.sadd(_doc_key(news.id), *weights.keys())
+        pipeline.sadd(SEARCH_DOCS_KEY, news.id)
+        pipeline.execute()
+    except Exception as e:
+        current_app.logger.error(e)
+
+
+def reindex_all(batch_size=500):
+    """
+    重建全部新闻的索引
+    先删除已有索引，再分批加载审核通过的新闻建立索引
+
+    :return: 建立索引的新闻数量
+    """
+    for news_id in redis_store.smembers(SEARCH_DOCS_KEY):
+        remove_news_index(int(news_id))
+    count = 0
+    last_id = 0
+    while True:
+        news_list = News.query.filter(News.status == 0, News.id > last_id) \
+            .order_by(News.id).limit(batch_size).all()
+        if not news_list:
+            break
+        for news in news_list:
+            index_news(news)
+        count += len(news_list)
+        last_id = news_list[-1].id
+    return count
+
+
+def search_news(keywords, page, per_page=constants.SEARCH_PAGE_MAX_NEWS):
+    """
+    搜索新闻
+    1、切分关键字，计算每个词的逆文档频率作为权重
+    2、对所有词的有序集合求交集，按权重求和排序；没有结果时求并集
+    3、排序结果在redis中缓存，翻页时直接读取
+
+    :return: (新闻id列表, 结果总数)
+    """
+    terms = list(set(tokenize(keywords)))
+    if not terms:
+        return [], 0
+    result_key = 'search_result_%s' % hashlib.md5(' '.join(sorted(terms)).encode()).hexdigest()
+    if not redis_store.exists(result_key):
+        pipeline = redis_store.pipeline()
+        pipeline.scard(SEARCH_DOCS_KEY)
+        for term in terms:
+            pipeline.zcard(_term_key(term))
+        results = pipeline.execute()
+        total_docs = results[0]
+        weights = {}
+        for term, df in zip(terms, results[1:]):
+            if df:
+                weights[_term_key(term)] = math.log(1 + total_docs / df)
+        if len(weights) == len(terms):
+            redis_store.zinterstore(result_key, weights)
+        if not redis_store.exists(result_key) and weights:
+            redis_store.zunionstore(result_key, weights)
+        # 没有结果时也缓存，避免重复计算
+        pipeline = redis_store.pipeline()
+        pipeline.zadd(result_key, 0, 0)
+        pipeline.expire(result_key, constants.SEARCH_RESULT_REDIS_EXPIRES)
+        pipeline.execute()
+    start = (page - 1) * per_page
+    pipeline = redis_store.pipeline()
+    # 占位成员0的分数为0，排在最后，不计入结果
+    pipeline.zrevrangebyscore(result_key, '+inf', '(0', start=start, num=per_page)
+    pipeline.zcount(result_key, '(0', '+inf')
+    news_ids, total = pipeline.execute()
+    return [int(news_id) for news_id in news_ids], total
@@ -0,0 +1,136 @@
+# 搜索提示：审核通过的新闻标题前缀索引保存在redis中
+# 每个前缀对应一个有序集合 新闻id -> 点击量，只保留点击量最高的SUGGEST_MAX_COUNT条
+# 查询时只需要读取一个有序集合，不再对标题使用LIKE查询
+import re
+
+from flask import current_app
+
+from info import redis_store, constants
+from info.models import News
+
+# 已建立前缀索引的新闻标题，hash结构 新闻id -> 标题
+SUGGEST_TITLES_KEY = 'suggest_titles'
+
+_SPACE_RE = re.compile(r'\s+')
+
+# 读取前缀对应的新闻id和标题，一次往返完成
+# KEYS[1] 前缀有序集合 KEYS[2] 标题hash
+# ARGV[1] 返回数量
+SUGGEST_SCRIPT = redis_store.register_script("""
+local ids = redis.call('ZREVRANGE', KEYS[1], 0, tonumber(ARGV[1]) - 1)
+if #ids == 0 then
+    return {}
+end
+local titles = redis.call('HMGET', KEYS[2], unpack(ids))
+local result = {}
+for i = 1, #ids do
+    if titles[i] then
+        result[#result + 1] = ids[i]
+        result[#result + 1] = titles[i]
+    end
+end
+return result
+""")
+
+
+def normalize(text):
+    """英文转成小写，合并连续的空白字符"""
+    return _SPACE_RE.sub(' ', (text or '').strip().lower())
+
+
+def _prefix_key(prefix):
+    return 'suggest_prefix_%s' % prefix
+
+
+def _prefixes(title):
+    """标题的全部前缀，最长SUGGEST_PREFIX_MAX_LENGTH个字符"""
+    title = normalize(title)[:constants.SUGGEST_PREFIX_MAX_LENGTH]
+    return [title[:i] for i in range(1, len(title) + 1)]
+
+
+def _remove(pipeline, news_id, title):
+    for prefix in _prefixes(title):
+        pipeline.zrem(_prefix_key(prefix), news_id)
+    pipeline.hdel(SUGGEST_TITLES_KEY, news_id)
+
+
+def remove_suggest(news_id):
+    """从前缀索引中删除新闻"""
+    try:
+        title = redis_store.hget(SUGGEST_TITLES_KEY, news_id)
+        if title is None:
+            return
+        pipeline = redis_store.pipeline()
+        _remove(pipeline, news_id, title)
+        pipeline.execute()
+    except Exception as e:
+        current_app.logger.error(e)
+
+
+def add_suggest(news):
+    """
+    建立或更新新闻的前缀索引
+    1、只有审核通过的新闻才建立索引，其他状态从索引中删除
+    2、标题被修改时，先删除旧标题的前缀
+    3、加入每个前缀的有序集合后，只保留点击量最高的SUGGEST_MAX_COUNT条
+    """
+    if news.status != 0:
+        remove_suggest(news.id)
+        return
+    try:
+        old_title = redis_store.hget(SUGGEST_TITLES_KEY, news.id)
+        pipeline = redis_store.pipeline()
+        if old_title is not None and old_title != news.title:
+            _remove(pipeline, news.id, old_title)
+        for prefix in _prefixes(news.title):
+            pipeline.zadd(_prefix_key(prefix), news.clicks or 0, news.id)
+            pipeline.zremrangebyrank(_prefix_key(prefix), 0, -constants.SUGGEST_MAX_COUNT - 1)
+        pipeline.hset(SUGGEST_TITLES_KEY, news.id, news.title)
+        pipeline.execute()
+    except Exception as e:
+        current_app.logger.error(e)
+
+
+def rebuild_suggest(batch_size=500):
+    """
+    重建全部新闻的前缀索引，同时按最新的点击量调整排序
+    先删除已有索引，再分批加载审核通过的新闻建立索引
+
+    :return: 建立索引的新闻数量
+    """
+    titles = redis_store.hgetall(SUGGEST_TITLES_KEY)
+    pipeline = redis_store.pipeline()
+    for news_id, title in titles.items():
+        _remove(pipeline, news_id, title)
+    pipeline.execute()
+    count = 0
+    last_id = 0
+    while True:
+        news_list = News.query.filter(News.status == 0, News.id > last_id) \
+            .order_by(News.id).limit(batch_size).all()
+        if not news_list:
+            break
+        for news in news_list:
+            add_suggest(news)
+        count += len(news_list)
+        last_id = news_list[-1].id
+    return count
+
+
+def get_suggestions(keywords, count=constants.SUGGEST_MAX_COUNT):
+    """
+    获取以关键字开头的新闻标题，按点击量从高到低排序
+    关键字超过最大前缀长度时，按最大前缀查询后再筛选完整的关键字
+
+    :return: [{'id': 新闻id, 'title': 标题}, ...]
+    """
+    keywords = normalize(keywords)
+    if not keywords:
+        return []
+    prefix = keywords[:constants.SUGGEST_PREFIX_MAX_LENGTH]
+    result = SUGGEST_SCRIPT(keys=[_prefix_key(prefix), SUGGEST_TITLES_KEY], args=[count])
+    suggestions = []
+    for i in range(0, len(result), 2):
+        if normalize(result[i + 1]).startswith(keywords):
+            suggestions.append({'id': int(result[i]), 'title': result[i + 1]})
+    return suggestions
@@ -0,0 +1,146 @@
+# 关注时间线：关注的作者发布的新闻
+# 新闻审核通过时推送到每个粉丝的时间线，时间线是redis中的有序集合 新闻id -> 新闻id，按id倒序即发布顺序
+# 粉丝数量超过TIMELINE_FANOUT_MAX_FOLLOWERS的作者不推送，粉丝读取时间线时从mysql查询后合并
+from flask import current_app
+
+from info import redis_store, db, constants
+from info.models import User, News, tb_user_follows
+from info.utils.news_cache import get_news_many
+
+# 时间线中的占位成员，用来区分"没有新闻"和"未缓存"
+# 占位成员分数为0，时间线超出长度被截断时最先删除，因此占位成员存在表示时间线是完整的
+PLACEHOLDER = '0'
+
+# 把新闻推送到已缓存的时间线，未缓存的时间线等读取时再加载
+# KEYS 粉丝的时间线
+# ARGV[1] 新闻id ARGV[2] 时间线长度
+PUSH_SCRIPT = redis_store.register_script("""
+for i = 1, #KEYS do
+    if redis.call('EXISTS', KEYS[i]) == 1 then
+        redis.call('ZADD', KEYS[i], ARGV[1], ARGV[1])
+        redis.call('ZREMRANGEBYRANK', KEYS[i], 0, -tonumber(ARGV[2]) - 1)
+    end
+end
+return 1
+""")
+
+
+def _timeline_key(user_id):
+    return 'user_timeline_%d' % user_id
+
+
+def _is_big_author(filter_big):
+    """筛选粉丝数量超过推送上限的作者，filter_big为False时筛选其他作者"""
+    if filter_big:
+        return User.followers_count > constants.TIMELINE_FANOUT_MAX_FOLLOWERS
+    return User.followers_count <= constants.TIMELINE_FANOUT_MAX_FOLLOWERS
+
+
+def _pull_news_ids(user_id, before_id, limit, *filters):
+    """从mysql查询关注的作者审核通过的新闻id，按id倒序"""
+    query = db.session.query(News.id) \
+        .join(tb_user_follows, tb_user_follows.c.followed_id == News.user_id) \
+        .join(User, User.id == News.user_id) \
+        .filter(tb_user_follows.c.follower_id == user_id, News.status == 0, *filters)
+    if before_id:
+        query = query.filter(News.id < before_id)
+    return [row.id for row in query.order_by(News.id.desc()).limit(limit).all()]
+
+
+def _follower_keys(author_id):
+    """分批生成作者粉丝的时间线键名"""
+    last_id = 0
+    while True:
+        rows = db.session.query(tb_user_follows.c.follower_id) \
+            .filter(tb_user_follows.c.followed_id == author_id, tb_user_follows.c.follower_id > last_id) \
+            .order_by(tb_user_follows.c.follower_id).limit(constants.TIMELINE_FANOUT_BATCH_SIZE).all()
+        if not rows:
+            break
+        yield [_timeline_key(row.follower_id) for row in rows]
+        last_id = rows[-1].follower_id
+
+
+def fanout_news(news):
+    """
+    新闻审核后同步粉丝的时间线
+    1、新闻没有作者，或作者粉丝数量超过推送上限时不推送
+    2、审核通过，分批推送到粉丝已缓存的时间线
+    3、审核不通过，从粉丝的时间线中删除
+    """
+    if not news.user_id:
+        return
+    try:
+        author = User.query.with_entities(User.followers_count).filter(User.id == news.user_id).first()
+        if not author or author.followers_count > constants.TIMELINE_FANOUT_MAX_FOLLOWERS:
+            return
+        for keys in _follower_keys(news.user_id):
+            if news.status == 0:
+                PUSH_SCRIPT(keys=keys, args=[news.id, constants.TIMELINE_MAX_COUNT])
+            else:
+                pipeline = redis_store.pipeline()
+                for key in keys:
+                    pipeline.zrem(key, news.id)
+                pipeline.execute()
+    except Exception as e:
+        current_app.logger.error(e)
+
+
+def invalidate_timeline(user_id):
+    """关注或取消关注后删除用户的时间线，下次读取时重新加载"""
+    try:
+        redis_store.delete(_timeline_key(user_id))
+    except Exception as e:
+        current_app.logger.error(e)
+
+
+def _load_timeline(user_id):
+    """从mysql加载粉丝数量未超过推送上限的作者的新闻，写入时间线"""
+    news_ids = _pull_news_ids(user_id, None, constants.TIMELINE_MAX_COUNT, _is_big_author(False))
+    key = _timeline_key(user_id)
+    pipeline = redis_store.pipeline()
+    pipeline.delete(key)
+    # 加载的数量达到上限时，更早的新闻未加载，不添加表示时间线完整的占位成员
+    if len(news_ids) < constants.TIMELINE_MAX_COUNT:
+        pipeline.zadd(key, 0, PLACEHOLDER)
+    for news_id in news_ids:
+        pipeline.zadd(key, news_id, news_id)
+    pipeline.expire(key, constants.TIMELINE_REDIS_EXPIRES)
+    pipeline.execute()
+
+
+def get_timeline(user_id, cursor, per_page=constants.TIMELINE_PAGE_MAX_NEWS):
+    """
+    按游标读取关注时间线
+    1、时间线未缓存时从mysql加载
+    2、从时间线读取游标之前的新闻id，多读一条用来判断是否还有下一页
+    3、时间线被截断且已读到末尾时，更早的新闻全部从mysql查询
+    4、合并粉丝数量超过推送上限的作者的新闻
+    5、redis不可用时全部从mysql查询
+
+    :param cursor: 上一页最后一条新闻的id，第一页为None
+    :return: (新闻字典列表, 下一页游标)，没有下一页时游标为None
+    """
+    limit = per_page + 1
+    key = _timeline_key(user_id)
+    try:
+        if not redis_store.exists(key):
+            _load_timeline(user_id)
+        pipeline = redis_store.pipeline()
+        pipeline.zrevrangebyscore(key, '(%d' % cursor if cursor else '+inf', '(0', start=0, num=limit)
+        pipeline.zscore(key, PLACEHOLDER)
+        cached_ids, complete = pipeline.execute()
+        news_ids = [int(news_id) for news_id in cached_ids]
+        if len(news_ids) < limit and complete is None:
+            news_ids = _pull_news_ids(user_id, cursor, limit)
+        else:
+            news_ids.extend(_pull_news_ids(user_id, cursor, limit, _is_big_author(True)))
+    except Exception as e:
+        current_app.logger.error(e)
+        news_ids = _pull_news_ids(user_id, cursor, limit)
+
+    news_ids = sorted(set(news_ids), reverse=True)
+    next_cursor = None
+    if len(news_ids) > per_page:
+        news_ids = news_ids[:per_page]
+        next_cursor = news_ids[-1]
+    return get_news_many(news_ids), next_cursor
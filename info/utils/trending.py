@@ -0,0 +1,185 @@
+# 热门新闻：浏览、评论、收藏、点赞按权重累加热度，热度随时间指数衰减
+# 使用前向衰减，事件发生时记入 权重 * e^((当前时间 - 基准时间) / tau)，已有的热度不需要修改
+# 有序集合中的分数都相对同一个基准时间，可以直接比较；基准时间由定时任务(manage.py trending)前移
+import math
+import time
+
+from flask import current_app
+
+from info import redis_store, constants
+from info.utils.news_cache import get_news_many
+from info.utils.news_feed import LATEST_CATEGORY_ID
+
+# 热度的基准时间，时间戳
+TRENDING_EPOCH_KEY = 'trending_epoch'
+
+# 各类事件的热度权重
+EVENT_WEIGHTS = {
+    'view': 1,
+    'like': 2,
+    'comment': 5,
+    'collect': 8,
+}
+
+# 衰减的时间常数，经过一个半衰期热度减半
+TAU = constants.TRENDING_HALF_LIFE / math.log(2)
+
+# 增加新闻的热度，热度不大于0时从有序集合中删除
+# 撤销事件时权重为负数，事件时间为原事件发生的时间，减去的热度等于原事件记入的热度
+# KEYS[1] 基准时间 KEYS[2...] 全部新闻、新闻所在分类的有序集合
+# ARGV[1] 新闻id ARGV[2] 权重 ARGV[3] 事件时间 ARGV[4] 时间常数
+INCR_SCRIPT = redis_store.register_script("""
+local event_time = tonumber(ARGV[3])
+local epoch = tonumber(redis.call('GET', KEYS[1]))
+if not epoch then
+    if tonumber(ARGV[2]) < 0 then
+        return 0
+    end
+    epoch = event_time
+    redis.call('SET', KEYS[1], ARGV[3])
+end
+local amount = tonumber(ARGV[2]) * math.exp((event_time - epoch) / tonumber(ARGV[4]))
+for i = 2, #KEYS do
+    local score = tonumber(redis.call('ZINCRBY', KEYS[i], amount, ARGV[1]))
+    if score <= 0 then
+        redis.call('ZREM', KEYS[i], ARGV[1])
+    end
+end
+return 1
+""")
+
+# 前移基准时间，按比例缩小全部热度，只保留热度最高的新闻
+# KEYS[1] 基准时间 KEYS[2...] 各分类的有序集合
+# ARGV[1] 当前时间 ARGV[2] 时间常数 ARGV[3] 保留数量 ARGV[4] 最低热度
+RESCALE_SCRIPT = redis_store.register_script("""
+local now = tonumber(ARGV[1])
+local epoch = tonumber(redis.call('GET', KEYS[1]))
+if not epoch then
+    epoch = now
+end
+local factor = math.exp((epoch - now) / tonumber(ARGV[2]))
+for i = 2, #KEYS do
+    redis.call('ZUNIONSTORE', KEYS[i], 1, KEYS[i], 'WEIGHTS', factor)
+    redis.call('ZREMRANGEBYSCORE', KEYS[i], '-inf', '(' .. ARGV[4])
+    redis.call('ZREMRANGEBYRANK', KEYS[i], 0, -tonumber(ARGV[3]) - 1)
+end
+redis.call('SET', KEYS[1], ARGV[1])
+return 1
+""")
+
+
+def _trending_key(category_id):
+    return 'trending_news_%d' % int(category_id)
+
+
+def _keys(category_id):
+    """全部新闻的有序集合，以及新闻所在分类的有序集合"""
+    keys = [_trending_key(LATEST_CATEGORY_ID)]
+    if category_id and int(category_id) != LATEST_CATEGORY_ID:
+        keys.append(_trending_key(category_id))
+    return keys
+
+
+def record_trending(news_id, category_id, event, sign=1, event_time=None):
+    """
+    记录新闻的事件，增加热度
+    只应对审核通过的新闻调用
+
+    :param event: view/like/comment/collect
+    :param sign: 1增加，-1撤销(取消收藏、取消点赞)
+    :param event_time: 撤销时传入原事件发生的时间戳，按原事件记入的热度扣除；
+                       没有原事件时间时不扣除，避免按当前时间扣除过多热度
+    """
+    if sign < 0 and event_time is None:
+        return
+    try:
+        INCR_SCRIPT(keys=[TRENDING_EPOCH_KEY] + _keys(category_id),
+                    args=[news_id, EVENT_WEIGHTS[event] * sign, event_time or time.time(), TAU])
+    except Exception as e:
+        current_app.logger.error(e)
+
+
+def _like_credit_key(news_id):
+    return 'trending_like_credit_%d' % int(news_id)
+
+
+def record_like_trending(news_id, category_id, comment_id, user_id):
+    """
+    记录评论点赞，每个用户对每条评论只计入一次热度
+    点赞记录在redis中没有点赞时间，取消点赞无法按原事件扣除热度，
+    反复点赞、取消点赞不会重复增加热度
+    """
+    try:
+        pipeline = redis_store.pipeline()
+        pipeline.sadd(_like_credit_key(news_id), '%s:%s' % (comment_id, user_id))
+        pipeline.expire(_like_credit_key(news_id), constants.TRENDING_LIKE_CREDIT_EXPIRES)
+        added, _ = pipeline.execute()
+    except Exception as e:
+        current_app.logger.error(e)
+        return
+    if added:
+        record_trending(news_id, category_id, 'like')
+
+
+def remove_trending(news_id, category_id):
+    """新闻审核不通过时，从热门新闻中删除"""
+    try:
+        pipeline = redis_store.pipeline()
+        for key in _keys(category_id):
+            pipeline.zrem(key, news_id)
+        pipeline.execute()
+    except Exception as e:
+        current_app.logger.error(e)
+
+
+def move_trending(news_id, old_category_id, category_id):
+    """新闻的分类被修改时，把热度移到新的分类"""
+    old_keys, keys = _keys(old_category_id)[1:], _keys(category_id)[1:]
+    if not old_keys or old_keys == keys:
+        return
+    try:
+        score = redis_store.zscore(old_keys[0], news_id)
+        if score is None:
+            return
+        pipeline = redis_store.pipeline()
+        pipeline.zrem(old_keys[0], news_id)
+        for key in keys:
+            pipeline.zadd(key, score, news_id)
+        pipeline.execute()
+    except Exception as e:
+        current_app.logger.error(e)
+
+
+def rescale_trending(category_ids):
+    """
+    前移基准时间到当前时间，避免热度随时间增长溢出
+    在同一个lua脚本中缩小热度和修改基准时间，期间记录的事件不会使用错误的基准时间
+
+    :param category_ids: 全部分类id
+    """
+    keys = [_trending_key(LATEST_CATEGORY_ID)]
+    keys.extend(_trending_key(cid) for cid in category_ids if int(cid) != LATEST_CATEGORY_ID)
+    RESCALE_SCRIPT(keys=[TRENDING_EPOCH_KEY] + keys,
+                   args=[time.time(), TAU, constants.TRENDING_KEEP_COUNT, constants.TRENDING_MIN_SCORE])
+
+
+def get_trending(category_ids, count=constants.TRENDING_MAX_COUNT):
+    """
+    一次获取多个分类的热门新闻
+    1、使用一次pipeline读取每个分类热度最高的新闻id
+    2、合并全部新闻id，一次获取新闻数据
+
+    :return: {分类id: 新闻字典列表}
+    """
+    pipeline = redis_store.pipeline()
+    for category_id in category_ids:
+        pipeline.zrevrange(_trending_key(category_id), 0, count - 1)
+    results = pipeline.execute()
+    news_ids = []
+    for ids in results:
+        news_ids.extend(int(news_id) for news_id in ids)
+    news_map = dict((news['id'], news) for news in get_news_many(list(set(news_ids))))
+    trending = {}
+    for category_id, ids in zip(category_ids, results):
+        trending[category_id] = [news_map[int(news_id)] for news_id in ids if int(news_id) in news_map]
+    return trending
@@ -0,0 +1,88 @@
+# 新闻独立访客统计：使用redis的HyperLogLog估算去重后的访客数量
+# 每条新闻每天一个HyperLogLog，无论访客多少最多占用12KB，误差约0.81%
+# 汇总任务(manage.py uv_rollup)把每日的数据合并到所在周、月的HyperLogLog，每日的数据只保留几天
+from datetime import datetime, timedelta
+
+from flask import current_app
+
+from info import redis_store, constants
+
+
+def _daily_key(day, news_id):
+    return 'news_uv_d%s_%d' % (day.strftime('%Y%m%d'), news_id)
+
+
+def _weekly_key(day, news_id):
+    year, week, _ = day.isocalendar()
+    return 'news_uv_w%d%02d_%d' % (year, week, news_id)
+
+
+def _monthly_key(day, news_id):
+    return 'news_uv_m%s_%d' % (day.strftime('%Y%m'), news_id)
+
+
+def _viewed_key(day):
+    """当天有访问的新闻id集合，汇总任务只需要合并这些新闻"""
+    return 'news_uv_ids_%s' % day.strftime('%Y%m%d')
+
+
+def record_viewer(news_id, viewer):
+    """
+    记录新闻的访客
+
+    :param viewer: 访客标识，登录用户为用户id，未登录用户为ip地址
+    """
+    today = datetime.now().date()
+    try:
+        pipeline = redis_store.pipeline()
+        pipeline.pfadd(_daily_key(today, news_id), viewer)
+        pipeline.expire(_daily_key(today, news_id), constants.NEWS_UV_DAILY_REDIS_EXPIRES)
+        pipeline.sadd(_viewed_key(today), news_id)
+        pipeline.expire(_viewed_key(today), constants.NEWS_UV_DAILY_REDIS_EXPIRES)
+        pipeline.execute()
+    except Exception as e:
+        current_app.logger.error(e)
+
+
+def rollup_viewers(day):
+    """
+    把指定日期的每日访客合并到所在周、月的访客
+    pfmerge是并集操作，重复执行不影响结果
+
+    :return: 合并的新闻数量
+    """
+    news_ids = [int(news_id) for news_id in redis_store.smembers(_viewed_key(day))]
+    pipeline = redis_store.pipeline()
+    for news_id in news_ids:
+        daily_key = _daily_key(day, news_id)
+        for key, expires in ((_weekly_key(day, news_id), constants.NEWS_UV_WEEKLY_REDIS_EXPIRES),
+                             (_monthly_key(day, news_id), constants.NEWS_UV_MONTHLY_REDIS_EXPIRES)):
+            pipeline.pfmerge(key, key, daily_key)
+            pipeline.expire(key, expires)
+    pipeline.execute()
+    return len(news_ids)
+
+
+def get_unique_viewers(news_ids):
+    """
+    批量获取新闻今日、本周、本月的独立访客数量，redis使用一次pipeline
+    本周、本月还没有汇总的日期，与每日的数据一起求并集，不依赖汇总任务是否已执行
+
+    :return: {新闻id: {'day': 数量, 'week': 数量, 'month': 数量}}
+    """
+    today = datetime.now().date()
+    # 每日的数据只保留NEWS_UV_DAILY_REDIS_EXPIRES，更早的日期只能读取汇总后的数据
+    recent_days = [today - timedelta(days=i)
+                   for i in range(constants.NEWS_UV_DAILY_REDIS_EXPIRES // 86400)]
+    week_days = [day for day in recent_days if day.isocalendar()[:2] == today.isocalendar()[:2]]
+    month_days = [day for day in recent_days if (day.year, day.month) == (today.year, today.month)]
+    pipeline = redis_store.pipeline()
+    for news_id in news_ids:
+        pipeline.pfcount(_daily_key(today, news_id))
+        pipeline.pfcount(_weekly_key(today, news_id), *[_daily_key(day, news_id) for day in week_days])
+        pipeline.pfcount(_monthly_key(today, news_id), *[_daily_key(day, news_id) for day in month_days])
+    results = pipeline.execute()
+    viewers = {}
+    for i, news_id in enumerate(news_ids):
+        viewers[news_id] = dict(zip(('day', 'week', 'month'), results[i * 3:i * 3 + 3]))
+    return viewers
@@ -0,0 +1,21 @@
+# 协程服务器：使用gevent运行项目，用于实时评论推送(/news/<id>/stream)等长连接
+# 每个连接只占用一个协程，几千个空闲连接只需要很少的内存
+# mysqlclient是C扩展，查询时会阻塞整个进程，部署时由nginx只把/news/<id>/stream转发到该服务，
+# 其他请求仍由原来的服务处理
+# 在终端使用命令：python live_server.py，指定端口：python live_server.py 5001
+from gevent import monkey
+monkey.patch_all()
+
+import sys
+
+from gevent.pywsgi import WSGIServer
+
+from manage import app
+
+
+if __name__ == '__main__':
+    # 协程服务器总是提供实时推送
+    app.config['NEWS_LIVE_STREAM'] = True
+    port = int(sys.argv[1]) if len(sys.argv) > 1 else 5001
+    print('协程服务器已启动，端口%d' % port)
+    WSGIServer(('0.0.0.0', port), app).serve_forever()
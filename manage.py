@@ -1,3 +1,6 @@
+import os
+import time
+from datetime import datetime, timedelta
 # 导入脚本管理器
 from flask_script import Manager
 # 从info目录下的__init__文件中导入创建app的函数
@@ -6,6 +9,18 @@ from info import create_app,db,models
 from flask_migrate import Migrate,MigrateCommand
 
 from info.models import User
+from info.utils.click_rank import seed_click_rank
+from info.utils.click_counter import flush_clicks as flush_pending_clicks
+from info.utils.news_feed import seed_latest_news
+from info.utils.counters import recount_counters
+from info.utils.comment_like import flush_comment_likes
+from info.utils.search import reindex_all
+from info.utils.suggest import rebuild_suggest
+from info.utils.trending import rescale_trending
+from info.utils.category_cache import get_categories
+from info.utils.related import compute_related
+from info.utils.unique_viewers import rollup_viewers
+from info.utils.assets import build_assets, BUILD_FOLDER
 # 调用info目录下的__init__文件的函数
 
 app = create_app('development')
@@ -42,10 +57,160 @@ def create_supperuser(name, password):
     print('管理员创建成功')
 
 
+# 初始化新闻点击排行
+# 从mysql加载新闻点击量，写入redis的有序集合
+# 在终端使用命令：python manage.py click_rank
+@manage.command
+def click_rank():
+    try:
+        count = seed_click_rank()
+    except Exception as e:
+        print(e)
+        return
+    print('点击排行初始化完成，共%d条新闻' % count)
+
+
+# 把redis中累加的新闻点击量写回mysql
+# 在终端使用命令：python manage.py flush_clicks
+# 指定间隔后持续运行：python manage.py flush_clicks -i 10
+@manage.option('-i', '-interval', dest='interval', type=int, default=0)
+def flush_clicks(interval):
+    while True:
+        try:
+            count = flush_pending_clicks()
+            print('点击量写回完成，共%d条新闻' % count)
+        except Exception as e:
+            print(e)
+        if not interval:
+            break
+        time.sleep(interval)
+
+
+# 初始化首页各分类的最新新闻id列表
+# 在终端使用命令：python manage.py latest_news
+@manage.command
+def latest_news():
+    try:
+        count = seed_latest_news()
+    except Exception as e:
+        print(e)
+        return
+    print('最新新闻列表初始化完成，共%d个分类' % count)
+
+
+# 重新统计新闻评论数、用户粉丝数、关注数和发布新闻数
+# 新增计数字段迁移后，或者计数出现偏差时执行
+# 在终端使用命令：python manage.py recount
+@manage.command
+def recount():
+    try:
+        recount_counters()
+    except Exception as e:
+        print(e)
+        return
+    print('计数字段统计完成')
+
+
+# 把redis中的评论点赞记录写回mysql
+# 在终端使用命令：python manage.py flush_likes
+# 指定间隔后持续运行：python manage.py flush_likes -i 10
+@manage.option('-i', '-interval', dest='interval', type=int, default=0)
+def flush_likes(interval):
+    while True:
+        try:
+            count = flush_comment_likes()
+            print('点赞记录写回完成，共%d条' % count)
+        except Exception as e:
+            print(e)
+        if not interval:
+            break
+        time.sleep(interval)
+
+
+# 重建新闻搜索的倒排索引
+# 在终端使用命令：python manage.py reindex
+@manage.command
+def reindex():
+    try:
+        count = reindex_all()
+    except Exception as e:
+        print(e)
+        return
+    print('搜索索引重建完成，共%d条新闻' % count)
+
+
+# 重建搜索提示的前缀索引，并按最新点击量排序，可以定时执行
+# 在终端使用命令：python manage.py suggest
+@manage.command
+def suggest():
+    try:
+        count = rebuild_suggest()
+    except Exception as e:
+        print(e)
+        return
+    print('搜索提示索引重建完成，共%d条新闻' % count)
+
+
+# 前移热门新闻热度的基准时间，需要定时执行，间隔应小于几十个半衰期
+# 在终端使用命令：python manage.py trending
+# 指定间隔后持续运行：python manage.py trending -i 3600
+@manage.option('-i', '-interval', dest='interval', type=int, default=0)
+def trending(interval):
+    while True:
+        try:
+            rescale_trending([category['id'] for category in get_categories()])
+            print('热门新闻热度重新计算完成')
+        except Exception as e:
+            print(e)
+        if not interval:
+            break
+        time.sleep(interval)
+
+
+# 计算相关新闻，默认只计算新审核、编辑的新闻
+# 在终端使用命令：python manage.py related
+# 全量计算：python manage.py related -f
+@manage.option('-f', '--full', dest='full', action='store_true', default=False)
+def related(full):
+    try:
+        count = compute_related(full)
+    except Exception as e:
+        print(e)
+        return
+    print('相关新闻计算完成，共%d条新闻' % count)
+
+
+# 把新闻的每日独立访客合并到每周、每月，需要每天执行
+# 在终端使用命令：python manage.py uv_rollup，默认合并昨天的数据
+# 指定日期：python manage.py uv_rollup -d 20180601
+@manage.option('-d', '-day', dest='day', default=None)
+def uv_rollup(day):
+    try:
+        if day:
+            day = datetime.strptime(day, '%Y%m%d').date()
+        else:
+            day = datetime.now().date() - timedelta(days=1)
+        count = rollup_viewers(day)
+    except Exception as e:
+        print(e)
+        return
+    print('独立访客合并完成，共%d条新闻' % count)
+
+
+# 发布静态文件：生成带哈希的文件名和预压缩的.gz、.br文件，每次部署时执行，执行后重启进程
+# 在终端使用命令：python manage.py assets
+# 安装brotli模块(pip install brotli)后才会生成.br文件
+@manage.command
+def assets():
+    try:
+        count = build_assets(app.static_folder, os.path.join(app.root_path, BUILD_FOLDER))
+    except Exception as e:
+        print(e)
+        return
+    print('静态文件发布完成，共%d个文件' % count)
 
 
 if __name__ == '__main__':
     # app.run()
     print(app.url_map)
     manage.run()
-